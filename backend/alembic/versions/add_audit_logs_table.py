@@ -0,0 +1,49 @@
+"""add audit_logs table
+
+Revision ID: add_audit_logs_001
+Revises: add_patient_dataset_idx_001
+Create Date: 2026-02-21
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_audit_logs_001'
+down_revision = 'add_patient_dataset_idx_001'
+branch_labels = None
+depends_on = None
+
+INDEXED_COLUMNS = ['user_id', 'resource_id', 'patient_id', 'timestamp']
+
+
+def upgrade() -> None:
+    # Existing databases got audit_logs from Base.metadata.create_all before it was migrated
+    if not op.get_context().as_sql and sa.inspect(op.get_bind()).has_table('audit_logs'):
+        return
+
+    op.create_table('audit_logs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('action', sa.String(), nullable=False),
+        sa.Column('resource_type', sa.String(), nullable=False),
+        sa.Column('resource_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('patient_id', postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column('field_accessed', sa.String(), nullable=True),
+        sa.Column('ip_address', sa.String(), nullable=True),
+        sa.Column('user_agent', sa.String(), nullable=True),
+        sa.Column('details', sa.Text(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    for column in INDEXED_COLUMNS:
+        op.create_index(op.f(f'ix_audit_logs_{column}'), 'audit_logs', [column], unique=False)
+
+
+def downgrade() -> None:
+    for column in reversed(INDEXED_COLUMNS):
+        op.drop_index(op.f(f'ix_audit_logs_{column}'), table_name='audit_logs')
+    op.drop_table('audit_logs')
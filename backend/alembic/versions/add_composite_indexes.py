@@ -0,0 +1,36 @@
+"""add composite indexes on patients and datasets
+
+Revision ID: add_composite_idx_001
+Revises: add_audit_logs_001
+Create Date: 2026-02-22
+
+"""
+from app.migration_ops import create_indexes, drop_indexes
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_composite_idx_001'
+down_revision = 'add_audit_logs_001'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns) - patient lookups go by dataset + patient_key, dataset listings by
+# session + user. Each composite makes the single-column index on its leading column redundant.
+COMPOSITE_INDEXES = [
+    ('ix_patients_dataset_id_patient_key', 'patients', ['dataset_id', 'patient_key']),
+    ('ix_datasets_session_id_user_id', 'datasets', ['session_id', 'user_id']),
+]
+REPLACED_INDEXES = [
+    ('ix_patients_dataset_id', 'patients', ['dataset_id']),
+    ('ix_datasets_session_id', 'datasets', ['session_id']),
+]
+
+
+def upgrade() -> None:
+    create_indexes(COMPOSITE_INDEXES)
+    drop_indexes(REPLACED_INDEXES)
+
+
+def downgrade() -> None:
+    create_indexes(REPLACED_INDEXES)
+    drop_indexes(COMPOSITE_INDEXES)
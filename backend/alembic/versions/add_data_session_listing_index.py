@@ -0,0 +1,30 @@
+"""add composite index on data_sessions (user_id, created_at)
+
+Revision ID: add_data_session_idx_001
+Revises: add_user_token_idx_001
+Create Date: 2026-02-25
+
+"""
+from app.migration_ops import create_indexes, drop_indexes
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_data_session_idx_001'
+down_revision = 'add_user_token_idx_001'
+branch_labels = None
+depends_on = None
+
+# Session listing filters by user and orders by created_at. The composite also serves plain
+# user_id lookups, so the single-column index goes.
+NEW_INDEX = ('ix_data_sessions_user_id_created_at', 'data_sessions', ['user_id', 'created_at'])
+REPLACED_INDEX = ('ix_data_sessions_user_id', 'data_sessions', ['user_id'])
+
+
+def upgrade() -> None:
+    create_indexes([NEW_INDEX])
+    drop_indexes([REPLACED_INDEX])
+
+
+def downgrade() -> None:
+    create_indexes([REPLACED_INDEX])
+    drop_indexes([NEW_INDEX])
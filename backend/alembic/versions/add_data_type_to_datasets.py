@@ -16,13 +16,40 @@ branch_labels = None
 depends_on = None
 
 
+# Rows updated per backfill transaction
+BACKFILL_BATCH_SIZE = 5000
+
+
 def upgrade() -> None:
     with op.batch_alter_table('datasets', schema=None) as batch_op:
         batch_op.add_column(sa.Column('data_type', sa.String(), nullable=True, server_default='generic'))
 
     # The server_default handles new and existing rows, but for older DBs, a manual update might be needed.
     # This is safe to run as it only affects rows where the column is NULL.
-    op.execute("UPDATE datasets SET data_type = 'generic' WHERE data_type IS NULL")
+    if op.get_context().as_sql:
+        # Offline (--sql) mode can't see row counts, so emit a single statement
+        op.execute("UPDATE datasets SET data_type = 'generic' WHERE data_type IS NULL")
+        return
+
+    # Backfill in small batches, each committed on its own, so no single transaction
+    # holds row locks on the whole table. On PostgreSQL, ctid = ANY(ARRAY(...)) lets
+    # each batch be fetched with a TID scan.
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        backfill = sa.text(
+            "UPDATE datasets SET data_type = 'generic' WHERE ctid = ANY(ARRAY("
+            "SELECT ctid FROM datasets WHERE data_type IS NULL LIMIT :batch_size))"
+        )
+    else:
+        backfill = sa.text(
+            "UPDATE datasets SET data_type = 'generic' WHERE id IN ("
+            "SELECT id FROM datasets WHERE data_type IS NULL LIMIT :batch_size)"
+        )
+    with op.get_context().autocommit_block():
+        while True:
+            result = bind.execute(backfill, {"batch_size": BACKFILL_BATCH_SIZE})
+            if result.rowcount == 0:
+                break
 
 
 def downgrade() -> None:
@@ -0,0 +1,27 @@
+"""add detected_columns to datasets
+
+Revision ID: add_detected_columns_001
+Revises: add_login_session_idx_001
+Create Date: 2026-02-27
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_detected_columns_001'
+down_revision = 'add_login_session_idx_001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Nullable with no backfill: existing datasets fill it from their file on first use
+    with op.batch_alter_table('datasets', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('detected_columns', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('datasets', schema=None) as batch_op:
+        batch_op.drop_column('detected_columns')
@@ -0,0 +1,26 @@
+"""add index on login_sessions.created_at
+
+Revision ID: add_login_session_idx_001
+Revises: add_data_session_idx_001
+Create Date: 2026-02-26
+
+"""
+from app.migration_ops import create_indexes, drop_indexes
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_login_session_idx_001'
+down_revision = 'add_data_session_idx_001'
+branch_labels = None
+depends_on = None
+
+# Expired login sessions are deleted by age on every session start
+CREATED_AT_INDEX = [('ix_login_sessions_created_at', 'login_sessions', ['created_at'])]
+
+
+def upgrade() -> None:
+    create_indexes(CREATED_AT_INDEX)
+
+
+def downgrade() -> None:
+    drop_indexes(CREATED_AT_INDEX)
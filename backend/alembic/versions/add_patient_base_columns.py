@@ -16,28 +16,43 @@ branch_labels = None
 depends_on = None
 
 
+# Base columns added to patients (in sync with patient-dashboard)
+BASE_COLUMNS = [
+    ('date_of_birth', sa.Date()),
+    ('age', sa.Integer()),
+    ('gender', sa.String()),
+    ('psa_level', sa.Float()),
+    ('clinical_stage', sa.String()),
+    ('ethnicity', sa.String()),
+    ('insurance', sa.String()),
+    ('phone', sa.String()),
+    ('email', sa.String()),
+    ('address', sa.Text()),
+]
+
+
 def upgrade() -> None:
-    # Add base columns to patients table (in sync with patient-dashboard)
-    op.add_column('patients', sa.Column('date_of_birth', sa.Date(), nullable=True))
-    op.add_column('patients', sa.Column('age', sa.Integer(), nullable=True))
-    op.add_column('patients', sa.Column('gender', sa.String(), nullable=True))
-    op.add_column('patients', sa.Column('psa_level', sa.Float(), nullable=True))
-    op.add_column('patients', sa.Column('clinical_stage', sa.String(), nullable=True))
-    op.add_column('patients', sa.Column('ethnicity', sa.String(), nullable=True))
-    op.add_column('patients', sa.Column('insurance', sa.String(), nullable=True))
-    op.add_column('patients', sa.Column('phone', sa.String(), nullable=True))
-    op.add_column('patients', sa.Column('email', sa.String(), nullable=True))
-    op.add_column('patients', sa.Column('address', sa.Text(), nullable=True))
+    dialect = op.get_context().dialect
+    if dialect.name == 'postgresql':
+        # One ALTER TABLE takes the table lock once instead of once per column
+        clauses = ", ".join(
+            f"ADD COLUMN {name} {column_type.compile(dialect=dialect)}"
+            for name, column_type in BASE_COLUMNS
+        )
+        op.execute(f"ALTER TABLE patients {clauses}")
+    else:
+        # SQLite can't combine ADD COLUMNs; batch mode applies them in a single table rebuild
+        with op.batch_alter_table('patients', schema=None) as batch_op:
+            for name, column_type in BASE_COLUMNS:
+                batch_op.add_column(sa.Column(name, column_type, nullable=True))
 
 
 def downgrade() -> None:
-    op.drop_column('patients', 'address')
-    op.drop_column('patients', 'email')
-    op.drop_column('patients', 'phone')
-    op.drop_column('patients', 'insurance')
-    op.drop_column('patients', 'ethnicity')
-    op.drop_column('patients', 'clinical_stage')
-    op.drop_column('patients', 'psa_level')
-    op.drop_column('patients', 'gender')
-    op.drop_column('patients', 'age')
-    op.drop_column('patients', 'date_of_birth')
+    dialect = op.get_context().dialect
+    if dialect.name == 'postgresql':
+        clauses = ", ".join(f"DROP COLUMN {name}" for name, _ in reversed(BASE_COLUMNS))
+        op.execute(f"ALTER TABLE patients {clauses}")
+    else:
+        with op.batch_alter_table('patients', schema=None) as batch_op:
+            for name, _ in reversed(BASE_COLUMNS):
+                batch_op.drop_column(name)
@@ -0,0 +1,26 @@
+"""add index on patients.dataset_id
+
+Revision ID: add_patient_dataset_idx_001
+Revises: add_patient_base_001
+Create Date: 2026-02-20
+
+"""
+from app.migration_ops import create_indexes, drop_indexes
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_patient_dataset_idx_001'
+down_revision = 'add_patient_base_001'
+branch_labels = None
+depends_on = None
+
+# Every patient listing, fill and reprocess query filters by dataset_id
+DATASET_INDEX = [('ix_patients_dataset_id', 'patients', ['dataset_id'])]
+
+
+def upgrade() -> None:
+    create_indexes(DATASET_INDEX)
+
+
+def downgrade() -> None:
+    drop_indexes(DATASET_INDEX)
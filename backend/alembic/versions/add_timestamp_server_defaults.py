@@ -0,0 +1,51 @@
+"""add server-side defaults for patient and dataset timestamps
+
+Revision ID: add_ts_server_defaults_001
+Revises: add_composite_idx_001
+Create Date: 2026-02-23
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_ts_server_defaults_001'
+down_revision = 'add_composite_idx_001'
+branch_labels = None
+depends_on = None
+
+# (table, columns) now filled by the database instead of Python on insert
+TIMESTAMP_COLUMNS = [
+    ('patients', ['created_at', 'updated_at']),
+    ('datasets', ['created_at']),
+]
+
+
+def _set_defaults(default) -> None:
+    if op.get_context().dialect.name == 'postgresql':
+        # Setting a default only touches the catalog; one ALTER per table
+        for table, columns in TIMESTAMP_COLUMNS:
+            action = f"SET DEFAULT {default}" if default else "DROP DEFAULT"
+            clauses = ", ".join(f"ALTER COLUMN {column} {action}" for column in columns)
+            op.execute(f"ALTER TABLE {table} {clauses}")
+    else:
+        for table, columns in TIMESTAMP_COLUMNS:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                for column in columns:
+                    batch_op.alter_column(
+                        column,
+                        existing_type=sa.DateTime(),
+                        server_default=sa.text(default) if default else None,
+                    )
+
+
+def upgrade() -> None:
+    if op.get_context().dialect.name == 'postgresql':
+        _set_defaults("(now() at time zone 'utc')")
+    else:
+        _set_defaults("(strftime('%Y-%m-%d %H:%M:%f', 'now'))")
+
+
+def downgrade() -> None:
+    _set_defaults(None)
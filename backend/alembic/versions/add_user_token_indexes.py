@@ -0,0 +1,29 @@
+"""add indexes on users.verification_token and users.reset_token
+
+Revision ID: add_user_token_idx_001
+Revises: add_ts_server_defaults_001
+Create Date: 2026-02-24
+
+"""
+from app.migration_ops import create_indexes, drop_indexes
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_user_token_idx_001'
+down_revision = 'add_ts_server_defaults_001'
+branch_labels = None
+depends_on = None
+
+# verify-email and reset-password look the user up by token
+TOKEN_INDEXES = [
+    ('ix_users_verification_token', 'users', ['verification_token']),
+    ('ix_users_reset_token', 'users', ['reset_token']),
+]
+
+
+def upgrade() -> None:
+    create_indexes(TOKEN_INDEXES)
+
+
+def downgrade() -> None:
+    drop_indexes(TOKEN_INDEXES)
@@ -2,24 +2,20 @@
 HIPAA-compliant audit logging for PHI access.
 Tracks who accessed what patient data and when.
 """
+import atexit
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from contextvars import ContextVar
 from datetime import datetime
+from typing import List, Optional
 from sqlalchemy import Column, String, DateTime, ForeignKey, Text
 from sqlalchemy.orm import relationship
-from app.db import Base as DBBase, DATABASE_URL
-import uuid
-
-# Use PostgreSQL UUID if available, otherwise use String for SQLite compatibility
-if DATABASE_URL.startswith("sqlite"):
-    UUIDType = String(36)
-    def uuid_default():
-        return str(uuid.uuid4())
-else:
-    from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
-    UUIDType = PostgresUUID(as_uuid=True)
-    def uuid_default():
-        return uuid.uuid4()
+from app.db import Base as DBBase, SessionLocal, dumps_json as _dumps
+# Same id column type as the other models (String(36) on SQLite, UUID on PostgreSQL),
+# chosen once at import in app.models
+from app.models import UUIDType, uuid_default
 
 
 class AuditLog(DBBase):
@@ -44,20 +40,81 @@ class AuditLog(DBBase):
     user = relationship("User", foreign_keys=[user_id])
 
 
+class JSONAuditFormatter(logging.Formatter):
+    """One JSON object per line, including the structured PHI access fields if present"""
+    
+    def format(self, record):
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        phi_access = getattr(record, "phi_access", None)
+        if phi_access is not None:
+            entry["phi_access"] = phi_access
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return _dumps(entry)
+
+
 # Configure audit logger
 audit_logger = logging.getLogger("audit")
 audit_logger.setLevel(logging.INFO)
 
-# Create file handler for audit logs if AUDIT_LOG_FILE is set
+# Create file handler for audit logs if AUDIT_LOG_FILE is set.
+# Records go through a queue so the disk write happens on the listener thread,
+# not in the request handling PHI access.
 audit_log_file = os.getenv("AUDIT_LOG_FILE")
 if audit_log_file:
     file_handler = logging.FileHandler(audit_log_file)
     file_handler.setLevel(logging.INFO)
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
+    # AUDIT_LOG_FORMAT=json writes JSON lines for log ingestion
+    if os.getenv("AUDIT_LOG_FORMAT", "text").lower() == "json":
+        formatter = JSONAuditFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+        )
     file_handler.setFormatter(formatter)
-    audit_logger.addHandler(file_handler)
+    
+    audit_log_queue = queue.SimpleQueue()
+    audit_log_listener = QueueListener(audit_log_queue, file_handler, respect_handler_level=True)
+    audit_log_listener.start()
+    # Flush queued records on shutdown
+    atexit.register(audit_log_listener.stop)
+    audit_logger.addHandler(QueueHandler(audit_log_queue))
+
+# Request-scoped buffer of pending audit rows, installed by AuditMiddleware and written
+# in one INSERT when the request finishes. Outside a request (scripts, background jobs)
+# there is no buffer and entries are written immediately.
+audit_buffer: ContextVar[Optional[List[dict]]] = ContextVar("audit_buffer", default=None)
+
+
+def write_audit_rows(rows: List[dict]):
+    """Insert buffered audit rows in a single executemany and commit once"""
+    if not rows:
+        return
+    db = SessionLocal()
+    try:
+        db.execute(AuditLog.__table__.insert(), rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        audit_logger.error(f"Failed to write {len(rows)} PHI access audit entries: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+def _log_access_message(row: dict):
+    audit_logger.info(
+        "PHI_ACCESS - User: %s, Action: %s, Resource: %s/%s, Patient: %s, Field: %s",
+        row["user_id"], row["action"], row["resource_type"], row["resource_id"],
+        row["patient_id"], row["field_accessed"],
+        extra={"phi_access": {
+            key: row[key] for key in ("user_id", "action", "resource_type", "resource_id", "patient_id", "field_accessed")
+        }}
+    )
 
 
 def log_phi_access(
@@ -85,8 +142,60 @@ def log_phi_access(
         field_accessed: Specific PHI field accessed (e.g., 'mrn', 'first_name', 'last_name')
         ip_address: IP address of the request
         user_agent: User agent string
-        details: Additional details as JSON string
+        details: Additional details as JSON string (dicts/lists are serialized)
+    
+    Inside a request the entry is buffered and written together with the request's other
+    entries by AuditMiddleware; otherwise it is committed immediately.
     """
+    if details is not None and not isinstance(details, str):
+        details = _dumps(details)
+    
+    buffer = audit_buffer.get()
+    if buffer is None:
+        log_phi_access_immediate(
+            db_session, user_id, action, resource_type, resource_id,
+            patient_id, field_accessed, ip_address, user_agent, details
+        )
+        return
+    
+    # Plain dict with defaults filled in, ready for a Core executemany INSERT
+    row = dict(
+        id=uuid_default(),
+        user_id=user_id,
+        action=action,
+        resource_type=resource_type,
+        resource_id=resource_id,
+        patient_id=patient_id,
+        field_accessed=field_accessed,
+        ip_address=ip_address,
+        user_agent=user_agent,
+        details=details,
+        timestamp=datetime.utcnow()
+    )
+    buffer.append(row)
+    
+    # Also log to file/console
+    _log_access_message(row)
+
+
+def log_phi_access_immediate(
+    db_session,
+    user_id,
+    action: str,
+    resource_type: str,
+    resource_id,
+    patient_id=None,
+    field_accessed=None,
+    ip_address=None,
+    user_agent=None,
+    details=None
+):
+    """
+    Log access to PHI and commit it right away, for callers (e.g. exports) that need
+    the audit row durable before continuing. Arguments are the same as log_phi_access.
+    """
+    if details is not None and not isinstance(details, str):
+        details = _dumps(details)
     try:
         audit_entry = AuditLog(
             user_id=user_id,
@@ -103,12 +212,10 @@ def log_phi_access(
         db_session.commit()
         
         # Also log to file/console
-        log_message = (
-            f"PHI_ACCESS - User: {user_id}, Action: {action}, "
-            f"Resource: {resource_type}/{resource_id}, "
-            f"Patient: {patient_id}, Field: {field_accessed}"
-        )
-        audit_logger.info(log_message)
+        _log_access_message(dict(
+            user_id=user_id, action=action, resource_type=resource_type,
+            resource_id=resource_id, patient_id=patient_id, field_accessed=field_accessed
+        ))
         
     except Exception as e:
         db_session.rollback()
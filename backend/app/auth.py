@@ -2,19 +2,40 @@
 Authentication utilities: password hashing, JWT tokens, session handling.
 """
 import os
+import time
 import uuid
+import hashlib
+import threading
 import jwt
 from datetime import datetime, timedelta
 from typing import Optional, Tuple, Any
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from app.db import get_db
-from app.models import User
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from app.db import get_db, DATABASE_URL
+from app.models import User, DataSession
+from app.session_store import get_session_cipher as get_cached_cipher
+from app.encryption import set_session_cipher
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Dialect is fixed for the life of the process.
+# Primary keys are String(36) on SQLite and native UUID on PostgreSQL.
+_IS_SQLITE = DATABASE_URL.startswith("sqlite")
+_coerce_id = str if _IS_SQLITE else (lambda value: uuid.UUID(str(value)))
+
+# Password hashing: new hashes use Argon2id (RFC 9106 low-memory profile); bcrypt hashes
+# from before the switch still verify and are rehashed on the next successful login
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1,
+    argon2__digest_size=32,
+    argon2__salt_size=16,
+)
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
@@ -24,12 +45,34 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Short-lived cache of User column values so authenticated requests can skip the users
+# lookup. Entries are dropped when the password or verification state changes.
+USER_CACHE_TTL_SECONDS = 60
+USER_CACHE_MAX_SIZE = 10000
+
+_user_cache: dict[str, dict] = {}
+_user_cache_lock = threading.Lock()
+_USER_COLUMNS = [attr.key for attr in inspect(User).column_attrs]
+
+# Decoded JWT payloads keyed by a hash of the token, so repeated requests with the same
+# token skip signature verification. Entries never outlive the token's own exp.
+TOKEN_CACHE_TTL_SECONDS = 60
+TOKEN_CACHE_MAX_SIZE = 50000
+
+_token_cache: dict[bytes, dict] = {}
+_token_cache_lock = threading.Lock()
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also returns a replacement hash when the stored one uses an outdated scheme"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
 def get_password_hash(password: str) -> str:
     """Hash a password"""
     return pwd_context.hash(password)
@@ -52,15 +95,71 @@ def create_access_token(
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
+def cache_user(user: User) -> None:
+    """Remember a freshly loaded user's column values for USER_CACHE_TTL_SECONDS."""
+    key = str(user.id)
+    entry = {
+        "columns": {name: getattr(user, name) for name in _USER_COLUMNS},
+        "expires_at": datetime.utcnow() + timedelta(seconds=USER_CACHE_TTL_SECONDS),
+    }
+    with _user_cache_lock:
+        if key not in _user_cache and len(_user_cache) >= USER_CACHE_MAX_SIZE:
+            # Evict the oldest entry (dicts keep insertion order)
+            _user_cache.pop(next(iter(_user_cache)))
+        _user_cache[key] = entry
+
+
+def get_cached_user(db: Session, user_id) -> Optional[User]:
+    """
+    Return the cached user attached to db without querying, or None on a miss.
+    The instance is rebuilt from the cached columns and merged with load=False.
+    """
+    key = str(user_id)
+    with _user_cache_lock:
+        entry = _user_cache.get(key)
+        if entry is not None and entry["expires_at"] < datetime.utcnow():
+            _user_cache.pop(key, None)
+            entry = None
+    if entry is None:
+        return None
+    user = User(**entry["columns"])
+    make_transient_to_detached(user)
+    return db.merge(user, load=False)
+
+
+def invalidate_cached_user(user_id) -> None:
+    """Drop a user from the cache after changing their password or account state."""
+    with _user_cache_lock:
+        _user_cache.pop(str(user_id), None)
+
+
 def decode_access_token(token: str) -> Optional[dict]:
     """Decode and verify a JWT token"""
+    key = hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+    now = time.time()
+    with _token_cache_lock:
+        entry = _token_cache.get(key)
+        if entry is not None:
+            if entry["expires_at"] > now:
+                return entry["payload"]
+            _token_cache.pop(key, None)
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except jwt.ExpiredSignatureError:
         return None
-    except jwt.JWTError:
+    except jwt.InvalidTokenError:
         return None
+    
+    expires_at = now + TOKEN_CACHE_TTL_SECONDS
+    if isinstance(payload.get("exp"), (int, float)):
+        expires_at = min(expires_at, payload["exp"])
+    with _token_cache_lock:
+        if key not in _token_cache and len(_token_cache) >= TOKEN_CACHE_MAX_SIZE:
+            # Evict the oldest entry (dicts keep insertion order)
+            _token_cache.pop(next(iter(_token_cache)))
+        _token_cache[key] = {"payload": payload, "expires_at": expires_at}
+    return payload
 
 
 async def get_current_user(
@@ -82,16 +181,16 @@ async def get_current_user(
     if user_id is None:
         raise credentials_exception
     
-    # Handle both UUID objects and strings
-    from app.db import DATABASE_URL
-    if DATABASE_URL.startswith("sqlite"):
-        user = db.query(User).filter(User.id == str(user_id)).first()
-    else:
-        import uuid
-        user = db.query(User).filter(User.id == uuid.UUID(user_id)).first()
-    
+    user = get_cached_user(db, user_id)
     if user is None:
-        raise credentials_exception
+        try:
+            user = db.get(User, _coerce_id(user_id))
+        except ValueError:
+            raise credentials_exception
+        
+        if user is None:
+            raise credentials_exception
+        cache_user(user)
     
     if not user.is_active:
         raise HTTPException(
@@ -125,10 +224,6 @@ async def get_current_session(
     Require an unlocked DataSession: get user and session_id from JWT,
     look up session key in cache, set request-scoped cipher, return (user, data_session).
     """
-    from app.models import DataSession
-    from app.session_store import get_session_cipher as get_cached_cipher
-    from app.encryption import set_session_cipher
-
     payload = decode_access_token(token)
     if not payload:
         raise HTTPException(
@@ -146,18 +241,20 @@ async def get_current_session(
             detail="No session selected. Unlock a session first."
         )
 
-    if DATABASE_URL.startswith("sqlite"):
-        user = db.query(User).filter(User.id == str(user_id)).first()
-        data_session = db.query(DataSession).filter(
-            DataSession.id == str(session_id),
-            DataSession.user_id == user.id
-        ).first() if user else None
-    else:
-        user = db.query(User).filter(User.id == uuid.UUID(str(user_id))).first()
-        data_session = db.query(DataSession).filter(
-            DataSession.id == uuid.UUID(str(session_id)),
-            DataSession.user_id == user.id
-        ).first() if user else None
+    try:
+        user_pk = _coerce_id(user_id)
+        session_pk = _coerce_id(session_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    user = get_cached_user(db, user_pk)
+    if user is None:
+        user = db.get(User, user_pk)
+        if user is not None:
+            cache_user(user)
+    data_session = db.get(DataSession, session_pk) if user else None
+    if data_session is not None and data_session.user_id != user.id:
+        data_session = None
 
     if not user or not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
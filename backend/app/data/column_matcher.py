@@ -2,7 +2,8 @@
 Column matching utilities for mapping CSV/Excel columns to patient fields
 """
 import re
-from typing import List, Dict, Tuple
+from functools import lru_cache
+from typing import List, Dict, Tuple, NamedTuple, Sequence, Union
 
 # Field mapping patterns - simple matching
 # Common fields that should always be matched if present
@@ -24,167 +25,226 @@ FIELD_PATTERNS = {
     "genetic_mutation": [r"genetic", r"mutation", r"gene", r"brca", r"^genetic risk$", r"^genetic$"],
 }
 
+# Critical fields (MRN, FN, LN) - matched first with their own, more literal patterns
+CRITICAL_FIELDS = {
+    "mrn": ["MRN", "M.R.N.", "mrn", "medical.*record", "patient.*id", "patient.*number"],
+    "first_name": ["FN", "F.N.", "fn", "First Name", "FirstName", "first.*name", "fname", "given.*name"],
+    "last_name": ["LN", "L.N.", "ln", "Last Name", "LastName", "last.*name", "lname", "surname", "family.*name"]
+}
+
+# Separators turned into spaces by normalize_column_name (runs are collapsed by split/join)
+_TRANS = str.maketrans({'_': ' ', '-': ' ', '\t': ' ', '\n': ' ', '\r': ' '})
+# Separators (and dots) dropped entirely when comparing compact names like "M.R.N." / "mrn"
+_STRIP_TRANS = str.maketrans('', '', '_- \t\n\r\f\v.')
+_PAREN_RE = re.compile(r'\([^)]*\)')
+_PATTERN_META_RE = re.compile(r'[.*^$]+')
+
+
+def _strip(value: str) -> str:
+    """Remove underscores, dashes, whitespace and dots"""
+    return value.translate(_STRIP_TRANS)
+
+
+class CompiledPattern(NamedTuple):
+    """A FIELD_PATTERNS entry with its regexes and literal forms precomputed"""
+    raw: str
+    search: re.Pattern
+    anchored: re.Pattern
+    literal: str  # pattern without regex markers, for exact column name comparison
+    clean: str  # literal with spaces removed, for direct string comparison
+
+
+@lru_cache(maxsize=1024)
+def _compile_pattern(raw: str) -> CompiledPattern:
+    return CompiledPattern(
+        raw=raw,
+        search=re.compile(raw, re.IGNORECASE),
+        anchored=re.compile(f"^{raw}$", re.IGNORECASE),
+        literal=raw.replace(r'.*', '').replace('^', '').replace('$', '').strip(),
+        clean=_PATTERN_META_RE.sub('', raw).replace(' ', '').lower(),
+    )
+
+
+def _pattern_priority(raw: str) -> Tuple[bool, int]:
+    """Anchored ^...$ patterns first (they can return 1.0 straight away), then shorter ones"""
+    return (not (raw.startswith('^') and raw.endswith('$')), len(raw))
+
+
+FIELD_PATTERNS_COMPILED = {
+    field: [_compile_pattern(raw) for raw in sorted(patterns, key=_pattern_priority)]
+    for field, patterns in FIELD_PATTERNS.items()
+}
+
+# One alternation of all of a field's patterns: a single search tells whether any of them
+# can match a column, so most (field, column) pairs skip the per-pattern loop
+FIELD_PREFILTERS = {
+    field: re.compile('|'.join(f"(?:{raw})" for raw in patterns), re.IGNORECASE)
+    for field, patterns in FIELD_PATTERNS.items()
+}
+
+def _compile_critical_pattern(raw: str) -> Tuple[re.Pattern, str, str]:
+    """Return (regex, upper-cased literal, compact literal) for a critical-field pattern"""
+    pattern_clean = _PATTERN_META_RE.sub('', raw).strip()
+    return re.compile(raw, re.IGNORECASE), pattern_clean.upper(), _strip(pattern_clean.lower())
+
+
+CRITICAL_FIELDS_COMPILED = {
+    field: [_compile_critical_pattern(raw) for raw in patterns]
+    for field, patterns in CRITICAL_FIELDS.items()
+}
+
+# Critical fields first, then the remaining FIELD_PATTERNS in declaration order
+FIELD_ORDER = list(dict.fromkeys([*CRITICAL_FIELDS, *FIELD_PATTERNS]))
+
+# Field names in compact form, e.g. "date_of_service" -> "dateofservice"
+FIELD_NAMES_NORMALIZED = {field: _strip(field.lower()) for field in FIELD_ORDER}
+
+# Minimum score for a suggestion - lower for critical fields so they match almost anything close
+DEFAULT_MATCH_THRESHOLD = 0.3
+MATCH_THRESHOLDS = {
+    "mrn": 0.1,
+    "first_name": 0.1,
+    "last_name": 0.1,
+    "date_of_service": 0.1,
+    "location": 0.1,
+}
+
 
 def normalize_column_name(col_name: str) -> str:
     """Normalize column name for matching"""
     if not col_name:
         return ""
-    normalized = re.sub(r'[_\-\s]+', ' ', str(col_name).lower().strip())
-    return normalized
+    normalized = str(col_name).lower().strip().translate(_TRANS)
+    return ' '.join(normalized.split())
+
+
+def _as_compiled(patterns: Sequence[Union[str, CompiledPattern]]) -> List[CompiledPattern]:
+    """Accept raw pattern strings as well as precompiled ones; invalid regexes are skipped"""
+    compiled = []
+    for pattern in patterns:
+        if isinstance(pattern, CompiledPattern):
+            compiled.append(pattern)
+            continue
+        try:
+            compiled.append(_compile_pattern(pattern))
+        except re.error:
+            continue
+    return compiled
 
 
-def calculate_match_score(column_name: str, patterns: List[str]) -> float:
-    """Calculate how well a column name matches patterns (0.0 to 1.0)"""
+def calculate_match_score(column_name: str, patterns: Sequence[Union[str, CompiledPattern]], prefilter: re.Pattern = None) -> float:
+    """
+    Calculate how well a column name matches patterns (0.0 to 1.0).
+    prefilter, if given, must match whenever any of the patterns does (see FIELD_PREFILTERS).
+    """
     normalized = normalize_column_name(column_name)
     if not normalized:
         return 0.0
-    
+    return _score_normalized(normalized, _as_compiled(patterns), prefilter)
+
+
+def _score_normalized(normalized: str, patterns: List[CompiledPattern], prefilter: re.Pattern = None) -> float:
+    """calculate_match_score for a column name that is already normalized and non-empty"""
     best_score = 0.0
-    for pattern in patterns:
-        try:
-            # Check for exact match first (full pattern match)
-            if re.match(f"^{pattern}$", normalized, re.IGNORECASE):
-                score = 1.0
-            # Check if pattern matches the entire normalized string (exact column name match)
-            elif normalized == pattern.replace(r'.*', '').replace('^', '').replace('$', '').strip():
-                score = 0.95
-            # Check for partial match
-            elif re.search(pattern, normalized, re.IGNORECASE):
-                match = re.search(pattern, normalized, re.IGNORECASE)
-                if match:
-                    matched_length = len(match.group())
-                    total_length = len(normalized)
-                    score = min(matched_length / max(total_length, 1), 0.9)
-                else:
-                    score = 0.0
+    if prefilter is not None and not prefilter.search(normalized):
+        # No regex can match, so only the literal comparisons can score
+        if any(normalized == pattern.literal for pattern in patterns):
+            best_score = 0.95
+        patterns_to_scan = ()
+    else:
+        patterns_to_scan = patterns
+    
+    for pattern in patterns_to_scan:
+        # Exact match (full pattern match) can't be beaten
+        if pattern.anchored.match(normalized):
+            return 1.0
+        # Check if pattern matches the entire normalized string (exact column name match)
+        if normalized == pattern.literal:
+            score = 0.95
+        # Check for partial match
+        else:
+            match = pattern.search.search(normalized)
+            if match:
+                matched_length = len(match.group())
+                total_length = len(normalized)
+                score = min(matched_length / max(total_length, 1), 0.9)
             else:
                 score = 0.0
-            
-            best_score = max(best_score, score)
-        except re.error:
-            continue
+        
+        best_score = max(best_score, score)
     
     # Also check for direct string match (case-insensitive, ignoring spaces/underscores)
-    normalized_clean = re.sub(r'[_\-\s]+', '', normalized)
+    normalized_clean = normalized.replace(' ', '')
     for pattern in patterns:
-        pattern_clean = re.sub(r'[.*^$]+', '', pattern).replace(' ', '').lower()
-        if normalized_clean == pattern_clean:
-            best_score = max(best_score, 1.0)
+        if normalized_clean == pattern.clean:
+            return 1.0
     
     return best_score
 
 
+def _critical_score(patterns: List[Tuple[re.Pattern, str, str]], col_clean: str, col_upper: str, col_normalized: str) -> float:
+    """Score a cleaned column against a critical field's literal patterns"""
+    score = 0.0
+    for pattern_re, pattern_upper, pattern_normalized in patterns:
+        # Exact match (case-insensitive, ignoring spaces/underscores/dots)
+        if col_normalized == pattern_normalized or col_upper == pattern_upper:
+            return 1.0
+        if pattern_re.search(col_clean):
+            score = 0.95
+    return score
+
+
 def suggest_column_mappings(csv_columns: List[str], existing_mapping: Dict[str, str] = None, data_type: str = "generic") -> Dict[str, Tuple[str, float]]:
     """Suggest column mappings - MUST match MRN, FN, LN if CSV has them"""
     if existing_mapping is None:
         existing_mapping = {}
     
-    patterns_to_use = FIELD_PATTERNS
     suggestions = {}
     used_columns = set(existing_mapping.values())
+    fields = [field for field in FIELD_ORDER if field not in existing_mapping]
     
-    # STEP 1: Match critical fields FIRST (MRN, FN, LN) - these MUST match
-    # Use flexible matching that handles variations like "MRN (string)", "First Name (FN)", etc.
-    critical_fields = {
-        "mrn": ["MRN", "M.R.N.", "mrn", "medical.*record", "patient.*id", "patient.*number"],
-        "first_name": ["FN", "F.N.", "fn", "First Name", "FirstName", "first.*name", "fname", "given.*name"],
-        "last_name": ["LN", "L.N.", "ln", "Last Name", "LastName", "last.*name", "lname", "surname", "family.*name"]
-    }
-    
-    for field_name, possible_patterns in critical_fields.items():
-        if field_name in existing_mapping or field_name in suggestions:
+    # Clean each column once - remove parentheses and extra text like "(string)", "(FN)", etc. -
+    # and keep its upper-case, compact ("firstname") and word ("first name") forms
+    col_info = []
+    for col_index, col in enumerate(csv_columns):
+        if col in used_columns:
             continue
-        
-        best_match = None
-        best_score = 0.0
-        
-        for col in csv_columns:
-            if col in used_columns:
-                continue
-            
-            # Clean column name - remove parentheses and extra text like "(string)", "(FN)", etc.
-            col_clean = re.sub(r'\([^)]*\)', '', col).strip()
-            col_upper = col_clean.upper().strip()
-            col_normalized = re.sub(r'[_\-\s\.]+', '', col_clean.lower())
-            
-            # Try exact matches first
-            for pattern in possible_patterns:
-                pattern_clean = re.sub(r'[.*^$]+', '', pattern).strip()
-                pattern_normalized = re.sub(r'[_\-\s\.]+', '', pattern_clean.lower())
-                
-                # Exact match (case-insensitive, ignoring spaces/underscores/dots)
-                if col_normalized == pattern_normalized or col_upper == pattern_clean.upper():
-                    best_match = col
-                    best_score = 1.0
-                    break
-                
-                # Check if pattern matches (using regex)
-                try:
-                    if re.search(pattern, col_clean, re.IGNORECASE):
-                        score = 0.95
-                        if score > best_score:
-                            best_score = score
-                            best_match = col
-                except re.error:
-                    pass
-            
-            # Also check if field name itself matches (e.g., "mrn" column matches "mrn" field)
-            field_normalized = re.sub(r'[_\-\s\.]+', '', field_name.lower())
-            if col_normalized == field_normalized:
-                if 1.0 > best_score:
-                    best_score = 1.0
-                    best_match = col
-        
-        if best_match and best_score > 0.5:  # Lower threshold for critical fields
-            suggestions[field_name] = (best_match, best_score)
-            used_columns.add(best_match)
+        col_clean = _PAREN_RE.sub('', col).strip()
+        col_info.append((col_index, col, col_clean, col_clean.upper(), _strip(col_clean.lower()), normalize_column_name(col_clean)))
     
-    # STEP 2: Match other fields by normalized name (including critical fields that weren't matched yet)
-    for field_name, patterns in patterns_to_use.items():
-        if field_name in existing_mapping or field_name in suggestions:
-            continue
-        
-        field_normalized = re.sub(r'[_\-\s\.]+', '', field_name.lower())
-        for col in csv_columns:
-            if col in used_columns:
-                continue
+    # Score every (field, column) pair in a single pass. Each candidate also records how it
+    # matched so that equal scores keep the old precedence: critical-field match (0), exact
+    # field name (1), then generic pattern score (2).
+    candidates = []
+    for col_index, col, col_clean, col_upper, col_normalized, col_words in col_info:
+        for field_index, field_name in enumerate(fields):
+            name_match = col_normalized == FIELD_NAMES_NORMALIZED[field_name]
+            critical_patterns = CRITICAL_FIELDS_COMPILED.get(field_name)
+            if critical_patterns:
+                score = 1.0 if name_match else _critical_score(critical_patterns, col_clean, col_upper, col_normalized)
+                rank = 0
+            elif name_match:
+                score, rank = 1.0, 1
+            else:
+                score, rank = 0.0, 2
             
-            # Clean column name - remove parentheses and extra text
-            col_clean = re.sub(r'\([^)]*\)', '', col).strip()
-            col_normalized = re.sub(r'[_\-\s\.]+', '', col_clean.lower())
+            patterns = FIELD_PATTERNS_COMPILED.get(field_name)
+            if patterns and score < 1.0 and col_words:
+                pattern_score = _score_normalized(col_words, patterns, FIELD_PREFILTERS[field_name])
+                if pattern_score > score:
+                    score, rank = pattern_score, 2
             
-            if field_normalized == col_normalized:
-                suggestions[field_name] = (col, 1.0)
-                used_columns.add(col)
-                break
+            if score > MATCH_THRESHOLDS.get(field_name, DEFAULT_MATCH_THRESHOLD):
+                candidates.append((score, rank, field_index, col_index, field_name, col))
     
-    # STEP 3: Pattern matching for remaining fields (including critical fields that still weren't matched)
-    for field_name, patterns in patterns_to_use.items():
-        if field_name in existing_mapping or field_name in suggestions:
+    # Greedy assignment over all pairs: highest score first, then match precedence, then
+    # field order (critical fields first) and column order
+    candidates.sort(key=lambda c: (-c[0], c[1], c[2], c[3]))
+    for score, _, _, _, field_name, col in candidates:
+        if field_name in suggestions or col in used_columns:
             continue
-        
-        best_match = None
-        best_score = 0.0
-        
-        for col in csv_columns:
-            if col in used_columns:
-                continue
-            
-            # Clean column name before matching
-            col_clean = re.sub(r'\([^)]*\)', '', col).strip()
-            score = calculate_match_score(col_clean, patterns)
-            if score > best_score:
-                best_score = score
-                best_match = col
-        
-        # Lower threshold for critical fields - be more aggressive
-        threshold = 0.3
-        if field_name in ['mrn', 'first_name', 'last_name', 'date_of_service', 'location']:
-            threshold = 0.1  # Very low threshold - match almost anything close
-        
-        if best_match and best_score > threshold:
-            suggestions[field_name] = (best_match, best_score)
-            used_columns.add(best_match)
+        suggestions[field_name] = (col, score)
+        used_columns.add(col)
     
     return suggestions
 
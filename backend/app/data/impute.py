@@ -7,13 +7,6 @@ from app.models import Patient
 
 def fill_patients(db, dataset_id: str, mode: str, patient_ids: List[str] = None):
     """Fill missing data for patients"""
-    query = db.query(Patient).filter(Patient.dataset_id == dataset_id)
-    
-    if patient_ids:
-        query = query.filter(Patient.id.in_(patient_ids))
-    
-    patients = query.all()
-    
     # No automatic calculations - calculated fields are added manually
     return {"filled": 0}
 
@@ -1,5 +1,6 @@
 import os
 import re
+import hashlib
 import logging
 from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
@@ -23,31 +24,82 @@ else:
 
 Base = declarative_base()
 
+# orjson is much faster than the stdlib encoder for JSON columns, audit details and JSON log lines
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+    # Non-str keys (e.g. numeric column headers) are stringified like the stdlib does
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    loads_json = orjson.loads
+except ImportError:
+    import json
+    ORJSON_AVAILABLE = False
+    loads_json = json.loads
+
+
+def dumps_json(value) -> str:
+    """Serialize to a JSON string, stringifying UUIDs, datetimes and other unknown types"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(value, default=str, option=_ORJSON_OPTIONS).decode("utf-8")
+    return json.dumps(value, default=str)
+
+
+def _ci(word: str) -> str:
+    """Case-insensitive regex for a literal key ('mrn' -> '[mM][rR][nN]') without re.IGNORECASE"""
+    return "".join(f"[{c.lower()}{c.upper()}]" if c.isalpha() else re.escape(c) for c in word)
+
+
+# PHI keys and their values in dict/JSON-like text, e.g. 'mrn': 'J029843' or "first_name": "Grady".
+# MRN values may be unquoted alphanumeric codes; name values must be quoted and may contain
+# commas/spaces ('Williams Jr, Grady'). One alternation so each text is scanned once.
+#
+# Value lengths are capped (MRN 32, names 128, 'raw' dict prefix 512 chars) so matching stays
+# linear on long statements such as bulk inserts of raw JSON payloads. The closing quote of a
+# name is optional, so an over-long or truncated value is still redacted up to the cap.
+# Keys use explicit case classes instead of re.IGNORECASE, which slows every class test.
+REDACT_KEYS_RE = re.compile(
+    r"['\"]?(?:"
+    rf"(?P<mrn>{_ci('mrn')})['\"]?\s*:\s*['\"]?[A-Za-z0-9]{{1,32}}['\"]?"
+    rf"|(?P<name>{_ci('first_name')}|{_ci('last_name')}|{_ci('fn')}|{_ci('ln')})['\"]?\s*:\s*['\"][^'\"]{{1,128}}['\"]?"
+    r")"
+)
+# Redacted keys are written in their canonical spelling
+_REDACTED_KEY_NAMES = {"mrn": "mrn", "first_name": "first_name", "last_name": "last_name", "fn": "FN", "ln": "LN"}
+
+# FN/LN inside 'raw' nested dictionaries
+REDACT_RAW_FN_RE = re.compile(rf"'{_ci('raw')}':\s*\{{[^}}]{{0,512}}'{_ci('fn')}':\s*['\"]([^'\"]{{1,128}})['\"]")
+REDACT_RAW_LN_RE = re.compile(rf"'{_ci('raw')}':\s*\{{[^}}]{{0,512}}'{_ci('ln')}':\s*['\"]([^'\"]{{1,128}})['\"]")
+
+
+# Every pattern above needs a "key:" pair with one of these keys ('raw' ones need FN/LN too)
+_REDACT_GATE_KEYS = ("mrn", "first_name", "last_name", "fn", "ln")
+
+
+def might_contain_phi(text: str) -> bool:
+    """Cheap substring check so statements like SELECT 1 / COMMIT skip the regexes entirely"""
+    if ":" not in text:
+        return False
+    lowered = text.lower()
+    return any(key in lowered for key in _REDACT_GATE_KEYS)
+
+
+def _redact_key_match(match):
+    key = match.group("mrn") or match.group("name")
+    return f"'{_REDACTED_KEY_NAMES[key.lower()]}': '[REDACTED]'"
+
 
 def redact_sensitive_data(text):
     """Redact MRN, first_name, and last_name from text"""
-    if not isinstance(text, str):
+    if not isinstance(text, str) or not might_contain_phi(text):
         return text
     
-    # More comprehensive patterns to catch various formats
-    # Redact MRN patterns (alphanumeric codes, can be in quotes or not)
-    # Handle: 'mrn': 'J029843', "mrn": "J029843", 'mrn': J029843
-    text = re.sub(r"['\"]?mrn['\"]?\s*:\s*['\"]?([A-Z0-9]+)['\"]?", r"'mrn': '[REDACTED]'", text, flags=re.IGNORECASE)
-    
-    # Redact first_name patterns - match any value after the key (including commas, spaces, etc.)
-    # Handle: 'first_name': 'Williams Jr, Grady', "first_name": "Williams Jr, Grady"
-    text = re.sub(r"['\"]?first_name['\"]?\s*:\s*['\"]([^'\"]+)['\"]", r"'first_name': '[REDACTED]'", text, flags=re.IGNORECASE)
-    
-    # Redact last_name patterns
-    text = re.sub(r"['\"]?last_name['\"]?\s*:\s*['\"]([^'\"]+)['\"]", r"'last_name': '[REDACTED]'", text, flags=re.IGNORECASE)
-    
-    # Also handle in raw data and other formats (FN, LN)
-    text = re.sub(r"['\"]?FN['\"]?\s*:\s*['\"]([^'\"]+)['\"]", r"'FN': '[REDACTED]'", text, flags=re.IGNORECASE)
-    text = re.sub(r"['\"]?LN['\"]?\s*:\s*['\"]([^'\"]+)['\"]", r"'LN': '[REDACTED]'", text, flags=re.IGNORECASE)
+    # Handle: 'mrn': 'J029843', "mrn": "J029843", 'mrn': J029843,
+    # 'first_name': 'Williams Jr, Grady', "last_name": "Lee", and FN/LN keys
+    text = REDACT_KEYS_RE.sub(_redact_key_match, text)
     
     # Handle cases in 'raw' nested dictionaries
-    text = re.sub(r"'raw':\s*\{[^}]*'FN':\s*['\"]([^'\"]+)['\"]", r"'raw': {...'FN': '[REDACTED]'", text, flags=re.IGNORECASE)
-    text = re.sub(r"'raw':\s*\{[^}]*'LN':\s*['\"]([^'\"]+)['\"]", r"'raw': {...'LN': '[REDACTED]'", text, flags=re.IGNORECASE)
+    text = REDACT_RAW_FN_RE.sub(r"'raw': {...'FN': '[REDACTED]'", text)
+    text = REDACT_RAW_LN_RE.sub(r"'raw': {...'LN': '[REDACTED]'", text)
     
     return text
 
@@ -57,7 +109,7 @@ class SensitiveDataFilter(logging.Filter):
     def filter(self, record):
         # Only redact from string messages, don't modify args to avoid breaking uvicorn's format
         try:
-            if hasattr(record, 'msg') and isinstance(record.msg, str):
+            if hasattr(record, 'msg') and isinstance(record.msg, str) and might_contain_phi(record.msg):
                 record.msg = redact_sensitive_data(record.msg)
         except Exception:
             # If anything goes wrong, just pass through unchanged
@@ -70,56 +122,150 @@ class SensitiveDataFilter(logging.Filter):
 sqlalchemy_logger = logging.getLogger('sqlalchemy.engine')
 sqlalchemy_logger.addFilter(SensitiveDataFilter())
 
+# Named parameters that always carry PHI
+_SENSITIVE_KEYS = frozenset({'mrn', 'first_name', 'last_name', 'FN', 'LN'})
 
-# Use SQLAlchemy event listener to intercept and redact SQL statements
-@event.listens_for(Engine, "before_cursor_execute")
-def receive_before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    """Intercept SQL statements and redact PHI before logging"""
-    # Redact sensitive data from SQL statement string
-    redacted_statement = redact_sensitive_data(statement)
-    
-    # Redact sensitive data from parameters
-    if parameters:
-        if isinstance(parameters, dict):
-            redacted_params = {}
-            for key, value in parameters.items():
-                if key in ['mrn', 'first_name', 'last_name', 'FN', 'LN']:
-                    redacted_params[key] = '[REDACTED]'
-                else:
-                    redacted_params[key] = value
-            parameters = redacted_params
-        elif isinstance(parameters, (list, tuple)):
-            # For positional parameters, we can't easily identify which is which
-            # So we'll redact any string that looks like a name or MRN
-            redacted_params = []
-            for param in parameters:
-                if isinstance(param, str):
-                    # Check if it looks like a name or MRN
-                    if re.match(r'^[A-Z][a-z]+', param) or re.match(r'^[A-Z0-9]{6,}', param):
-                        redacted_params.append('[REDACTED]')
-                    else:
-                        redacted_params.append(param)
-                else:
-                    redacted_params.append(param)
-            parameters = tuple(redacted_params) if isinstance(parameters, tuple) else redacted_params
-    
-    return redacted_statement, parameters
+# Positional parameters that look like a name (Capitalized) or an MRN (6+ upper/digits)
+_PARAM_RE = re.compile(r'^(?:[A-Z][a-z]|[A-Z0-9]{6,})')
+
+
+def _looks_like_phi(param) -> bool:
+    if not isinstance(param, str):
+        return False
+    # Both shapes need an uppercase/digit first char - reject everything else before the regex
+    first = param[:1]
+    return len(param) >= 2 and first.isascii() and (first.isupper() or first.isdigit()) \
+        and _PARAM_RE.match(param) is not None
+
+
+# Structured query log, scrubbed by parameter key rather than by regex over formatted SQL.
+# Enable with logging.getLogger("app.db.sql").setLevel(logging.DEBUG). Each statement's text is
+# logged once under a stable sql_id; later executions only carry the id and scrubbed params.
+sql_logger = logging.getLogger("app.db.sql")
+_SQL_IDS_LOGGED: set = set()
+_SQL_IDS_MAX = 10000
 
 
+# Anonymous bind names get a numeric suffix, e.g. patients.mrn = :mrn_1
+_BIND_SUFFIX_RE = re.compile(r'_\d+$')
+
+
+def _is_sensitive_key(key) -> bool:
+    return key in _SENSITIVE_KEYS or _BIND_SUFFIX_RE.sub('', key) in _SENSITIVE_KEYS
+
+
+def _scrub_value(key, value):
+    if _is_sensitive_key(key):
+        return '[REDACTED]'
+    # JSON columns (raw, extra_fields, ...) hold whole source rows under arbitrary column
+    # names, so their contents are never logged - only their size
+    if isinstance(value, dict):
+        return f'[JSON {len(value)} keys]'
+    if isinstance(value, (list, tuple)):
+        return f'[JSON {len(value)} items]'
+    return value
+
+
+def _scrub_param(param):
+    # Driver-level parameters carry JSON columns already serialized
+    if isinstance(param, str) and param[:1] in ('{', '['):
+        return '[JSON]'
+    return '[REDACTED]' if _looks_like_phi(param) else param
+
+
+def _scrub_params(parameters):
+    if isinstance(parameters, dict):
+        return {key: _scrub_value(key, value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_scrub_param(param) for param in parameters]
+    return parameters
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def log_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Log executed statements as JSON with PHI parameters redacted"""
+    if not sql_logger.isEnabledFor(logging.DEBUG):
+        return
+
+    sql_id = hashlib.blake2b(statement.encode("utf-8"), digest_size=8).hexdigest()
+    entry = {"sql_id": sql_id, "rowcount": cursor.rowcount}
+    if sql_id not in _SQL_IDS_LOGGED:
+        if len(_SQL_IDS_LOGGED) >= _SQL_IDS_MAX:
+            _SQL_IDS_LOGGED.clear()
+        _SQL_IDS_LOGGED.add(sql_id)
+        entry["sql"] = redact_sensitive_data(statement)
+    if executemany:
+        # Bulk inserts: the row count is enough, the values would dwarf the log
+        entry["executemany"] = len(parameters)
+    elif parameters:
+        # Prefer the named parameters SQLAlchemy compiled (scrubbed by key) over the driver's
+        # positional ones, which can only be scrubbed by guessing from the value
+        compiled = getattr(context, "compiled_parameters", None)
+        entry["params"] = _scrub_params(compiled[0] if compiled else parameters)
+    sql_logger.debug(dumps_json(entry))
+
+
+# Pre-ping costs a SELECT 1 roundtrip per checkout. Leave it off on stable networks (docker-compose,
+# or PG with tcp_keepalives_idle tuned) and turn it on behind proxies that drop idle connections.
+DB_PRE_PING = os.getenv("DB_PRE_PING", "false").lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds
+
 # Configure engine based on database type
 if DATABASE_URL.startswith("sqlite"):
     # SQLite-specific configuration for ephemeral storage
     engine = create_engine(
         DATABASE_URL,
         connect_args={"check_same_thread": False},  # Needed for SQLite
-        pool_pre_ping=True
+        pool_pre_ping=DB_PRE_PING,
+        json_serializer=dumps_json,
+        json_deserializer=loads_json
     )
+
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_conn, _):
+        # WAL + NORMAL sync drops the per-commit fsync (fine for ephemeral session data),
+        # mmap avoids read syscalls and temp tables/sorts stay in memory
+        cur = dbapi_conn.cursor()
+        for pragma in (
+            "journal_mode=WAL",
+            "synchronous=NORMAL",
+            "temp_store=MEMORY",
+            "mmap_size=268435456",
+            "cache_size=-65536",
+        ):
+            cur.execute(f"PRAGMA {pragma}")
+        cur.close()
 else:
     # PostgreSQL configuration
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_PRE_PING,
+        # Patient.raw/extra_fields and Dataset.column_map go through these on every row
+        json_serializer=dumps_json,
+        json_deserializer=loads_json
+    )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def warm_pool(n: int = DB_POOL_SIZE):
+    """Open n pooled connections up front so the first requests don't pay for connect + auth"""
+    if DATABASE_URL.startswith("sqlite"):
+        return
+    # Hold them all at once - opening and closing one at a time would just reuse a single connection
+    conns = []
+    try:
+        for _ in range(n):
+            conns.append(engine.connect())
+    finally:
+        for conn in conns:
+            conn.close()
+
+
 def get_db():
     """Dependency for getting database session"""
     db = SessionLocal()
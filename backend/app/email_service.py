@@ -3,9 +3,10 @@ Email service for password reset and verification
 """
 import os
 import logging
+from functools import lru_cache
 from typing import Optional
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
-from jinja2 import Template
+from jinja2 import DictLoader, Environment
 
 logger = logging.getLogger(__name__)
 
@@ -20,55 +21,77 @@ MAIL_STARTTLS = os.getenv("MAIL_TLS", "true").lower() == "true"
 MAIL_SSL_TLS = os.getenv("MAIL_SSL", "false").lower() == "true"
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:5173")
 
-# Configure FastMail
-conf = ConnectionConfig(
-    MAIL_USERNAME=MAIL_USERNAME,
-    MAIL_PASSWORD=MAIL_PASSWORD,
-    MAIL_FROM=MAIL_FROM,
-    MAIL_PORT=MAIL_PORT,
-    MAIL_SERVER=MAIL_SERVER,
-    MAIL_STARTTLS=MAIL_STARTTLS,
-    MAIL_SSL_TLS=MAIL_SSL_TLS,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
-)
-
-fastmail = FastMail(conf)
-
-
-async def send_password_reset_email(email: str, reset_token: str) -> bool:
-    """Send password reset email"""
-    if not MAIL_USERNAME or not MAIL_PASSWORD:
-        logger.warning("Email not configured. Set MAIL_USERNAME and MAIL_PASSWORD environment variables.")
-        return False
-    
-    reset_url = f"{FRONTEND_URL}/reset-password?token={reset_token}"
-    
-    html_content = f"""
+# Email bodies are compiled once at import; both share the layout and <style> block in "base.html"
+_EMAIL_TEMPLATES = {
+    "base.html": """
     <!DOCTYPE html>
     <html>
     <head>
         <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .button {{ display: inline-block; padding: 12px 24px; background-color: #6366f1; color: white; text-decoration: none; border-radius: 8px; margin: 20px 0; }}
-            .button:hover {{ background-color: #4f46e5; }}
+            body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+            .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+            .button { display: inline-block; padding: 12px 24px; background-color: #6366f1; color: white; text-decoration: none; border-radius: 8px; margin: 20px 0; }
+            .button:hover { background-color: #4f46e5; }
         </style>
     </head>
     <body>
         <div class="container">
+            {% block content %}{% endblock %}
+        </div>
+    </body>
+    </html>
+    """,
+    "password_reset.html": """{% extends "base.html" %}{% block content %}
             <h2>Password Reset Request</h2>
             <p>You requested to reset your password for Data Manager.</p>
             <p>Click the button below to reset your password:</p>
-            <a href="{reset_url}" class="button">Reset Password</a>
+            <a href="{{ url }}" class="button">Reset Password</a>
             <p>Or copy and paste this link into your browser:</p>
-            <p><a href="{reset_url}">{reset_url}</a></p>
+            <p><a href="{{ url }}">{{ url }}</a></p>
             <p>This link will expire in 1 hour.</p>
             <p>If you didn't request this, please ignore this email.</p>
-        </div>
-    </body>
-    </html>
-    """
+    {% endblock %}""",
+    "verification.html": """{% extends "base.html" %}{% block content %}
+            <h2>Verify Your Email</h2>
+            <p>Thank you for signing up for Data Manager!</p>
+            <p>Please verify your email address by clicking the button below:</p>
+            <a href="{{ url }}" class="button">Verify Email</a>
+            <p>Or copy and paste this link into your browser:</p>
+            <p><a href="{{ url }}">{{ url }}</a></p>
+            <p>If you didn't create an account, please ignore this email.</p>
+    {% endblock %}""",
+}
+_jinja_env = Environment(loader=DictLoader(_EMAIL_TEMPLATES), autoescape=True)
+_RESET_TPL = _jinja_env.get_template("password_reset.html")
+_VERIFICATION_TPL = _jinja_env.get_template("verification.html")
+
+
+@lru_cache(maxsize=1)
+def _get_mailer() -> FastMail:
+    """Build the FastMail client on first send rather than at import"""
+    conf = ConnectionConfig(
+        MAIL_USERNAME=MAIL_USERNAME,
+        MAIL_PASSWORD=MAIL_PASSWORD,
+        MAIL_FROM=MAIL_FROM,
+        MAIL_PORT=MAIL_PORT,
+        MAIL_SERVER=MAIL_SERVER,
+        MAIL_STARTTLS=MAIL_STARTTLS,
+        MAIL_SSL_TLS=MAIL_SSL_TLS,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True
+    )
+    return FastMail(conf)
+
+
+async def send_password_reset_email(email: str, reset_token: str) -> bool:
+    """Send password reset email"""
+    if not MAIL_USERNAME or not MAIL_PASSWORD:
+        logger.warning("Email not configured. Set MAIL_USERNAME and MAIL_PASSWORD environment variables.")
+        return False
+    
+    reset_url = f"{FRONTEND_URL}/reset-password?token={reset_token}"
+    
+    html_content = _RESET_TPL.render(url=reset_url)
     
     message = MessageSchema(
         subject="Password Reset - Data Manager",
@@ -78,7 +101,7 @@ async def send_password_reset_email(email: str, reset_token: str) -> bool:
     )
     
     try:
-        await fastmail.send_message(message)
+        await _get_mailer().send_message(message)
         logger.info(f"Password reset email sent to {email}")
         return True
     except Exception as e:
@@ -94,30 +117,7 @@ async def send_verification_email(email: str, verification_token: str) -> bool:
     
     verification_url = f"{FRONTEND_URL}/verify-email?token={verification_token}"
     
-    html_content = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <style>
-            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-            .button {{ display: inline-block; padding: 12px 24px; background-color: #6366f1; color: white; text-decoration: none; border-radius: 8px; margin: 20px 0; }}
-            .button:hover {{ background-color: #4f46e5; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h2>Verify Your Email</h2>
-            <p>Thank you for signing up for Data Manager!</p>
-            <p>Please verify your email address by clicking the button below:</p>
-            <a href="{verification_url}" class="button">Verify Email</a>
-            <p>Or copy and paste this link into your browser:</p>
-            <p><a href="{verification_url}">{verification_url}</a></p>
-            <p>If you didn't create an account, please ignore this email.</p>
-        </div>
-    </body>
-    </html>
-    """
+    html_content = _VERIFICATION_TPL.render(url=verification_url)
     
     message = MessageSchema(
         subject="Verify Your Email - Data Manager",
@@ -127,7 +127,7 @@ async def send_verification_email(email: str, verification_token: str) -> bool:
     )
     
     try:
-        await fastmail.send_message(message)
+        await _get_mailer().send_message(message)
         logger.info(f"Verification email sent to {email}")
         return True
     except Exception as e:
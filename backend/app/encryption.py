@@ -5,30 +5,133 @@ Supports per-session encryption: when a DataSession is unlocked, its key is used
 """
 import os
 import base64
+import hashlib
 import logging
+import tempfile
+from functools import lru_cache
 from contextvars import ContextVar
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 logger = logging.getLogger(__name__)
 
+# Fernet tokens are already urlsafe base64 and always start with this prefix (version byte 0x80).
+# Older rows were base64-encoded a second time and are unwrapped on read.
+FERNET_TOKEN_PREFIX = b"gAAAAA"
+
+# Base64 of a Fernet token prefix - what legacy double-encoded values start with
+LEGACY_TOKEN_PREFIX = b"Z0FBQUFB"
+
+# AES-GCM tokens: VERSION_PREFIX + urlsafe base64 of version byte + 12-byte nonce + ciphertext/tag.
+# The text prefix lets is_encrypted/decrypt tell ciphertext apart without decoding it.
+VERSION_PREFIX = "v1:"
+_VERSION_PREFIX_BYTES = VERSION_PREFIX.encode()
+GCM_VERSION = b"\x02"
+GCM_NONCE_SIZE = 12
+
+# Decrypted values kept per cipher; list endpoints re-decrypt the same MRNs/names repeatedly
+DECRYPT_CACHE_SIZE = 4096
+
+_ENCRYPTED_PREFIXES = (VERSION_PREFIX, FERNET_TOKEN_PREFIX.decode(), LEGACY_TOKEN_PREFIX.decode())
+
+
+class PHICipher:
+    """
+    AES-256-GCM cipher for PHI values, keyed from an existing Fernet key via HKDF.
+    GCM authenticates in the same pass as it encrypts (AES-NI/CLMUL), unlike Fernet's CBC + HMAC.
+    Values written by Fernet (current and legacy double-encoded) are still decrypted.
+    """
+
+    def __init__(self, fernet_key: bytes):
+        self._fernet = Fernet(fernet_key)
+        key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"data-manager phi aes-gcm",
+        ).derive(base64.urlsafe_b64decode(fernet_key))
+        self._aead = AESGCM(key)
+        # Per-instance, so one session's plaintext is never served for another session's cipher
+        self.decrypt = lru_cache(maxsize=DECRYPT_CACHE_SIZE)(self._decrypt)
+
+    def encrypt(self, data: bytes) -> bytes:
+        nonce = os.urandom(GCM_NONCE_SIZE)
+        return _VERSION_PREFIX_BYTES + base64.urlsafe_b64encode(GCM_VERSION + nonce + self._aead.encrypt(nonce, data, None))
+
+    def _decrypt(self, token: bytes) -> bytes:
+        if token.startswith(_VERSION_PREFIX_BYTES):
+            token = token[len(_VERSION_PREFIX_BYTES):]
+        elif token.startswith(FERNET_TOKEN_PREFIX):
+            return self._fernet.decrypt(token)
+        raw = base64.urlsafe_b64decode(token)
+        if raw[:1] == GCM_VERSION:
+            return self._aead.decrypt(raw[1:1 + GCM_NONCE_SIZE], raw[1 + GCM_NONCE_SIZE:], None)
+        # Legacy double-encoded Fernet token
+        return self._fernet.decrypt(raw)
+
+
 # Request-scoped session cipher: when set, encrypt_phi/decrypt_phi use this for the current request
-_current_session_cipher: ContextVar[Fernet | None] = ContextVar("session_cipher", default=None)
+_current_session_cipher: ContextVar[PHICipher | None] = ContextVar("session_cipher", default=None)
 
 
-def set_session_cipher(cipher: Fernet | None) -> None:
-    """Set the Fernet cipher for the current request (used when a DataSession is unlocked)."""
+def set_session_cipher(cipher: PHICipher | None) -> None:
+    """Set the PHI cipher for the current request (used when a DataSession is unlocked)."""
     _current_session_cipher.set(cipher)
 
 
-def get_session_cipher() -> Fernet | None:
+def get_session_cipher() -> PHICipher | None:
     """Get the request-scoped session cipher if set."""
     return _current_session_cipher.get()
 
 # Get encryption key from environment variable
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
 
+KDF_SALT = b'data_manager_salt'  # In production, use a random salt stored securely
+KDF_ITERATIONS = 100000
+# Opt-in: directory (ideally tmpfs) where the password-derived key is cached so worker
+# restarts skip PBKDF2. Leave unset to always derive - the cached file is key material.
+KDF_CACHE_DIR = os.getenv("ENCRYPTION_KDF_CACHE_DIR")
+
+
+def _derive_fernet_key(password: str) -> bytes:
+    """Derive a Fernet key from a password, using the opt-in on-disk cache when configured."""
+    cache_path = None
+    if KDF_CACHE_DIR:
+        digest = hashlib.sha256(password.encode() + KDF_SALT + str(KDF_ITERATIONS).encode()).hexdigest()[:16]
+        cache_path = os.path.join(KDF_CACHE_DIR, f".dm_kdf_{digest}")
+        try:
+            st = os.stat(cache_path)
+            # Only trust a file that is ours and not readable by anyone else
+            if st.st_uid == os.getuid() and not st.st_mode & 0o077:
+                with open(cache_path, 'rb') as f:
+                    key = f.read().strip()
+                if len(key) == 44:
+                    return key
+        except OSError:
+            pass
+
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=KDF_SALT,
+        iterations=KDF_ITERATIONS,
+    )
+    key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
+
+    if cache_path:
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=KDF_CACHE_DIR)  # created 0600
+            with os.fdopen(fd, 'wb') as f:
+                f.write(key)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not cache derived encryption key: {e}")
+    return key
+
+
 if not ENCRYPTION_KEY:
     # Generate a key if not provided (for development only - MUST be set in production)
     logger.warning("⚠️  ENCRYPTION_KEY not set! Generating a temporary key. THIS IS NOT SECURE FOR PRODUCTION!")
@@ -42,19 +145,12 @@ try:
         # If key is provided as string, encode it
         if len(ENCRYPTION_KEY) == 44 and ENCRYPTION_KEY.endswith('='):
             # Looks like a base64 Fernet key
-            cipher_suite = Fernet(ENCRYPTION_KEY.encode())
+            cipher_suite = PHICipher(ENCRYPTION_KEY.encode())
         else:
             # Derive key from password using PBKDF2
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=b'data_manager_salt',  # In production, use a random salt stored securely
-                iterations=100000,
-            )
-            key = base64.urlsafe_b64encode(kdf.derive(ENCRYPTION_KEY.encode()))
-            cipher_suite = Fernet(key)
+            cipher_suite = PHICipher(_derive_fernet_key(ENCRYPTION_KEY))
     else:
-        cipher_suite = Fernet(ENCRYPTION_KEY)
+        cipher_suite = PHICipher(ENCRYPTION_KEY)
 except Exception as e:
     logger.error(f"Failed to initialize encryption: {e}")
     raise
@@ -73,8 +169,7 @@ def encrypt_phi(data: str) -> str:
         return None
     suite = get_session_cipher() or cipher_suite
     try:
-        encrypted_bytes = suite.encrypt(data.encode('utf-8'))
-        return base64.urlsafe_b64encode(encrypted_bytes).decode('utf-8')
+        return suite.encrypt(data.encode('utf-8')).decode('ascii')
     except Exception as e:
         logger.error(f"Encryption failed: {e}")
         raise ValueError(f"Failed to encrypt PHI data: {e}")
@@ -85,7 +180,7 @@ def decrypt_phi(encrypted_data: str) -> str:
     Decrypt Protected Health Information (PHI).
     
     Args:
-        encrypted_data: Base64-encoded encrypted string
+        encrypted_data: AES-GCM or Fernet token (or a legacy base64-wrapped Fernet token)
     
     Returns:
         Plaintext PHI data
@@ -102,8 +197,7 @@ def decrypt_phi(encrypted_data: str) -> str:
     suite = get_session_cipher() or cipher_suite
     try:
         try:
-            decoded_bytes = base64.urlsafe_b64decode(encrypted_data.encode('utf-8'))
-            decrypted_bytes = suite.decrypt(decoded_bytes)
+            decrypted_bytes = suite.decrypt(encrypted_data.encode('ascii'))
             return decrypted_bytes.decode('utf-8')
         except Exception:
             logger.warning(f"Decryption failed, assuming plaintext: {encrypted_data[:20]}...")
@@ -127,10 +221,5 @@ def is_encrypted(data: str) -> bool:
     if not data or not isinstance(data, str):
         return False
     
-    try:
-        # Encrypted data should be base64 and longer than plaintext
-        base64.urlsafe_b64decode(data.encode('utf-8'))
-        # If it's valid base64 and reasonably long, assume encrypted
-        return len(data) > 20
-    except Exception:
-        return False
+    # Prefix checks only - current tokens carry VERSION_PREFIX, older rows are Fernet tokens
+    return data.startswith(_ENCRYPTED_PREFIXES)
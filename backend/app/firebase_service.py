@@ -1,19 +1,27 @@
 import os
+from functools import lru_cache
 import firebase_admin
 from firebase_admin import credentials, auth
 
 FIREBASE_SERVICE_ACCOUNT_KEY_PATH = os.getenv("FIREBASE_SERVICE_ACCOUNT_KEY_PATH")
 
-if FIREBASE_SERVICE_ACCOUNT_KEY_PATH:
+
+@lru_cache(maxsize=1)
+def _get_app():
+    """Initialize the Firebase app on first send rather than at import; None when not configured"""
+    if not FIREBASE_SERVICE_ACCOUNT_KEY_PATH:
+        return None
     cred = credentials.Certificate(FIREBASE_SERVICE_ACCOUNT_KEY_PATH)
-    firebase_admin.initialize_app(cred)
+    return firebase_admin.initialize_app(cred)
+
 
 def send_firebase_otp(email):
-    if not firebase_admin._apps:
-        return False
     try:
+        app = _get_app()
+        if app is None:
+            return False
         # This will send a sign-in link to the user's email
-        link = auth.generate_sign_in_with_email_link(email, None)
+        link = auth.generate_sign_in_with_email_link(email, None, app=app)
         # You can then use this link to sign in the user
         # For now, we will just send the link
         # In a real application, you would send this link in an email
@@ -1,15 +1,20 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.db import engine, Base, DATABASE_URL
+from fastapi.responses import JSONResponse, ORJSONResponse
+from app.db import engine, Base, DATABASE_URL, ORJSON_AVAILABLE, warm_pool
 from app.routes import datasets, patients, fields, session, auth
 from app.middleware import AuditMiddleware
 from app.audit import AuditLog
 import logging
 from alembic import command
 from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
 import os
 import time
-from sqlalchemy import text
+from sqlalchemy import inspect, text
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
@@ -19,32 +24,41 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def wait_for_database(max_retries=30, retry_delay=1):
-    """Wait for database to be ready"""
-    for i in range(max_retries):
+def wait_for_database(timeout=30.0, initial_delay=0.05, max_delay=2.0):
+    """Wait for database to be ready, backing off exponentially up to `timeout` seconds"""
+    if DATABASE_URL.startswith("sqlite"):
+        # SQLite is a local file - always ready
+        return True
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempt = 0
+    while True:
+        attempt += 1
         try:
-            with engine.connect() as conn:
+            # AUTOCOMMIT: the probe doesn't need a transaction
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
                 conn.execute(text("SELECT 1"))
             logger.info("✅ Database connection ready")
             return True
         except Exception as e:
-            if i < max_retries - 1:
-                logger.debug(f"Waiting for database... ({i+1}/{max_retries})")
-                time.sleep(retry_delay)
-            else:
-                logger.warning(f"⚠️  Database not ready after {max_retries} retries: {e}")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"⚠️  Database not ready after {timeout:.0f}s ({attempt} attempts): {e}")
                 return False
-    return False
+            if attempt % 5 == 0:
+                # Drop any half-open connections left behind by repeated failures
+                engine.dispose()
+            logger.debug(f"Waiting for database... (attempt {attempt})")
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 1.7, max_delay)
 
-def run_migrations_automatically():
-    """Automatically detect and apply database migrations on startup"""
+def run_migrations_automatically() -> bool:
+    """Automatically detect and apply database migrations on startup. Returns True on success."""
     try:
         # Wait for database to be ready
         if not wait_for_database():
             logger.warning("⚠️  Skipping migrations - database not ready")
-            return
-        
-        logger.info("🔄 Applying database migrations...")
+            return False
         
         # Get Alembic config - handle both local and Docker paths
         current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -57,11 +71,31 @@ def run_migrations_automatically():
         
         if not os.path.exists(alembic_ini_path):
             logger.warning(f"⚠️  Could not find alembic.ini at {alembic_ini_path}")
-            return
+            return False
         
         alembic_cfg = Config(alembic_ini_path)
         alembic_cfg.set_main_option("sqlalchemy.url", DATABASE_URL)
         
+        # Compare the stamped revision with the script heads first, so warm starts
+        # don't load the Alembic environment or open a migration transaction
+        heads = set(ScriptDirectory.from_config(alembic_cfg).get_heads())
+        with engine.connect() as conn:
+            current = set(MigrationContext.configure(conn).get_current_heads())
+            fresh = not current and not inspect(conn).get_table_names()
+        if current == heads:
+            logger.info("✅ Database schema at head")
+            return True
+        
+        if fresh:
+            # Empty database: build the schema from the models in one pass and mark it as head,
+            # instead of replaying every migration
+            logger.info("🆕 Empty database - creating schema and stamping head")
+            Base.metadata.create_all(bind=engine)
+            command.stamp(alembic_cfg, "head")
+            return True
+        
+        logger.info("🔄 Applying database migrations...")
+        
         # Apply any pending migrations first
         try:
             command.upgrade(alembic_cfg, "head")
@@ -69,65 +103,65 @@ def run_migrations_automatically():
         except Exception as e:
             logger.error(f"❌ Migration upgrade failed: {e}")
             logger.error("💡 Please check the migration files and fix any errors")
-            return  # Don't try to create new migrations if upgrade failed
+            return False  # Don't try to create new migrations if upgrade failed
         
         # NOTE: Auto-generation of migrations is DISABLED on startup to prevent infinite loops
         # Migrations should be created manually using: alembic revision --autogenerate -m "description"
+        return True
         
     except Exception as e:
         logger.error(f"❌ Could not run automatic migrations: {e}", exc_info=True)
         logger.info("💡 Database will use existing schema")
-
-# Run migrations automatically on startup
-run_migrations_automatically()
-
-# Create tables (fallback if migrations don't cover everything)
-# This includes User, Dataset, Patient, and AuditLog tables
-# AuditLog uses the same Base, so it will be created automatically
-Base.metadata.create_all(bind=engine)
+        return False
 
 # Auto-clear data on startup if EPHEMERAL_STORAGE and CLEAR_ON_STARTUP are enabled
 CLEAR_ON_STARTUP = os.getenv("CLEAR_ON_STARTUP", "false").lower() == "true"
 USE_EPHEMERAL_STORAGE = os.getenv("EPHEMERAL_STORAGE", "false").lower() == "true"
 
-if CLEAR_ON_STARTUP or USE_EPHEMERAL_STORAGE:
+# How startup migrations run: "sync" (before serving requests), "async" (in the background
+# while the app already serves requests) or "skip" (migrations are applied out of band)
+MIGRATION_MODE = os.getenv("MIGRATION_MODE", "sync").lower()
+
+# pending -> running -> done | failed, or skipped; exposed at /healthz/migrations
+MIGRATION_STATUS = "pending"
+
+
+def clear_data_on_startup():
+    """Delete all patients, datasets and uploaded files (ephemeral/session mode)"""
     try:
         from app.db import SessionLocal
         from app.models import Dataset, Patient
         from sqlalchemy import delete
-        from pathlib import Path
         
         logger.info("🔄 Clearing all data on startup (ephemeral/session mode)...")
         db = SessionLocal()
         try:
-            # Delete all patients
-            patient_count = db.query(Patient).count()
-            db.execute(delete(Patient))
-            
-            # Delete all datasets and their files
-            datasets = db.query(Dataset).all()
-            dataset_count = len(datasets)
-            upload_dir = Path("uploads")
-            
-            for dataset in datasets:
-                file_path = Path(dataset.stored_path)
-                if file_path.exists():
-                    try:
-                        file_path.unlink()
-                    except Exception:
-                        pass
+            # Delete all patients (the FK has no ON DELETE CASCADE, so this stays explicit)
+            patient_count = db.execute(delete(Patient)).rowcount
             
-            db.execute(delete(Dataset))
+            # Delete all datasets and collect their file paths in the same statement
+            stored_paths = db.execute(delete(Dataset).returning(Dataset.stored_path)).scalars().all()
+            dataset_count = len(stored_paths)
             db.commit()
             
-            # Clean upload directory
-            if upload_dir.exists():
-                for file_path in upload_dir.iterdir():
-                    if file_path.is_file():
-                        try:
-                            file_path.unlink()
-                        except Exception:
-                            pass
+            # Unlink directly instead of stat-ing first; a missing file is fine
+            for stored_path in set(stored_paths):
+                try:
+                    os.unlink(stored_path)
+                except OSError:
+                    pass
+            
+            # Clean upload directory - scandir's DirEntry.is_file() uses the cached dirent type
+            try:
+                with os.scandir("uploads") as entries:
+                    for entry in entries:
+                        if entry.is_file(follow_symlinks=False):
+                            try:
+                                os.unlink(entry.path)
+                            except OSError:
+                                pass
+            except FileNotFoundError:
+                pass
             
             logger.info(f"✅ Cleared {dataset_count} datasets and {patient_count} patients on startup")
         except Exception as e:
@@ -138,13 +172,61 @@ if CLEAR_ON_STARTUP or USE_EPHEMERAL_STORAGE:
     except Exception as e:
         logger.warning(f"⚠️  Could not initialize data clearing: {e}")
 
+
+def prepare_schema():
+    """Apply migrations and create any missing tables"""
+    global MIGRATION_STATUS
+    if MIGRATION_MODE == "skip":
+        MIGRATION_STATUS = "skipped"
+    else:
+        MIGRATION_STATUS = "running"
+        MIGRATION_STATUS = "done" if run_migrations_automatically() else "failed"
+    
+    # Create tables as a fallback when migrations didn't run (e.g. SQLite, or MIGRATION_MODE=skip).
+    # Migrations cover every table including audit_logs, so a clean run skips the catalog probes.
+    if MIGRATION_STATUS != "done":
+        Base.metadata.create_all(bind=engine)
+
+
+def warm_connection_pool():
+    try:
+        warm_pool()
+    except Exception as e:
+        logger.warning(f"⚠️  Could not warm connection pool: {e}")
+
+
+async def prepare_database():
+    """Bring the schema up to date, then warm the pool and clear data (if enabled) concurrently"""
+    await asyncio.to_thread(prepare_schema)
+    tasks = [asyncio.to_thread(warm_connection_pool)]
+    if CLEAR_ON_STARTUP or USE_EPHEMERAL_STORAGE:
+        # Needs the tables, so it can only start once the schema step is done
+        tasks.append(asyncio.to_thread(clear_data_on_startup))
+    await asyncio.gather(*tasks)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs once per worker process after it starts, not at import time
+    if MIGRATION_MODE == "async":
+        # Serve requests (and /healthz/migrations) while the schema is brought up to date
+        app.state.prepare_task = asyncio.create_task(prepare_database())
+    else:
+        await prepare_database()
+    yield
+
+
 app = FastAPI(
     title="Data Manager API",
     description="API for managing patient data - upload files, manage columns, and edit records",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # orjson encodes response bodies in C; fall back to the stdlib encoder if it isn't installed
+    default_response_class=ORJSONResponse if ORJSON_AVAILABLE else JSONResponse,
 )
 
-# Audit middleware (must be first to capture request metadata)
+# Middleware added later wraps the earlier ones, so CORS (added below) is the outermost layer:
+# preflights are answered there before AuditMiddleware runs. Audit stays closest to the routes.
 app.add_middleware(AuditMiddleware)
 
 # CORS middleware - support both local development and production
@@ -160,8 +242,9 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Explicit lists turn preflight checks into set lookups instead of echoing request headers
+    allow_methods=["GET", "POST", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type"],
 )
 
 # Include routers
@@ -177,6 +260,11 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/healthz/migrations")
+async def migrations_health():
+    return {"mode": MIGRATION_MODE, "status": MIGRATION_STATUS}
+
+
 @app.get("/")
 async def root():
     return {"message": "Data Manager API"}
@@ -2,25 +2,72 @@
 Middleware for capturing request metadata for audit logging.
 """
 from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.audit import audit_buffer, write_audit_rows
 
+# ASGI header names arrive lower-cased, so a plain bytes compare finds the header
+USER_AGENT = b"user-agent"
 
-class AuditMiddleware(BaseHTTPMiddleware):
-    """Middleware to capture IP address and user agent for audit logging"""
+
+def read_client_metadata(scope: Scope) -> dict:
+    """IP address and user agent straight from the ASGI scope, without building Headers"""
+    client = scope.get("client")
+    user_agent = None
+    for key, value in scope["headers"]:
+        if key == USER_AGENT:
+            user_agent = value.decode("latin-1")
+            break
+    return {"ip_address": client[0] if client else None, "user_agent": user_agent}
+
+
+async def _flush_audit_rows(rows: list):
+    batch = rows[:]
+    rows.clear()
+    await run_in_threadpool(write_audit_rows, batch)
+
+
+class AuditMiddleware:
+    """
+    Middleware to capture IP address and user agent for audit logging.
+    Plain ASGI rather than BaseHTTPMiddleware, so requests don't pay for an extra task per call.
+    """
     
-    async def dispatch(self, request: Request, call_next):
-        # Store request metadata for use in route handlers
-        request.state.ip_address = request.client.host if request.client else None
-        request.state.user_agent = request.headers.get("user-agent")
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Preflights never reach a handler that audits, so skip the metadata and buffer setup
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        
+        # Store request metadata for use in route handlers (request.state reads scope["state"])
+        scope.setdefault("state", {}).update(read_client_metadata(scope))
+        
+        # Collect PHI access entries for this request and write them in one batch
+        # before the response is returned
+        rows = []
+        token = audit_buffer.set(rows)
+        
+        async def send_with_audit(message: Message):
+            if message["type"] == "http.response.start" and rows:
+                await _flush_audit_rows(rows)
+            await send(message)
         
-        response = await call_next(request)
-        return response
+        try:
+            await self.app(scope, receive, send_with_audit)
+        finally:
+            audit_buffer.reset(token)
+            # Anything logged after the response started (streaming) or when no response was sent
+            if rows:
+                await _flush_audit_rows(rows)
 
 
 def get_request_metadata(request: Request):
     """Extract IP address and user agent from request"""
-    return {
-        "ip_address": request.client.host if request.client else None,
-        "user_agent": request.headers.get("user-agent")
-    }
+    state = request.scope.get("state")
+    if state and "ip_address" in state:
+        # Already read by AuditMiddleware
+        return {"ip_address": state["ip_address"], "user_agent": state["user_agent"]}
+    return read_client_metadata(request.scope)
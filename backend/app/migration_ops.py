@@ -0,0 +1,31 @@
+"""
+Index operations shared by the Alembic migrations
+"""
+from typing import Iterable, List, Tuple
+from alembic import op
+
+# (index name, table, columns)
+IndexSpec = Tuple[str, str, List[str]]
+
+
+def create_indexes(indexes: Iterable[IndexSpec]) -> None:
+    """Create indexes, concurrently on PostgreSQL so the tables stay writable"""
+    if op.get_context().dialect.name == 'postgresql':
+        # CREATE INDEX CONCURRENTLY can't run inside a transaction
+        with op.get_context().autocommit_block():
+            for name, table, columns in indexes:
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+    else:
+        for name, table, columns in indexes:
+            op.create_index(name, table, columns, unique=False)
+
+
+def drop_indexes(indexes: Iterable[IndexSpec]) -> None:
+    """Drop indexes, concurrently on PostgreSQL"""
+    if op.get_context().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            for name, _, _ in indexes:
+                op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    else:
+        for name, table, _ in indexes:
+            op.drop_index(name, table_name=table)
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, JSON, Boolean, TypeDecorator
+from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, JSON, Boolean, TypeDecorator, Index, func, text
 from sqlalchemy.dialects.postgresql import UUID as PostgresUUID
 from sqlalchemy.orm import relationship
 from app.db import Base, DATABASE_URL
@@ -11,22 +11,22 @@ class EncryptedString(TypeDecorator):
     """SQLAlchemy type for encrypted PHI strings"""
     impl = String
     cache_ok = True
+    # Bound once on the class to skip the module-global lookup per value
+    _encrypt = staticmethod(encrypt_phi)
+    _decrypt = staticmethod(decrypt_phi)
     
     def process_bind_param(self, value, dialect):
         """Encrypt value before storing in database"""
-        if value is None:
+        if not value:
             return None
-        if isinstance(value, str) and value.strip():
-            return encrypt_phi(value)
-        return None
+        # encrypt_phi stringifies non-str values and maps blank strings to None
+        return self._encrypt(value)
     
     def process_result_value(self, value, dialect):
         """Decrypt value after loading from database"""
-        if value is None:
+        if not value:
             return None
-        if isinstance(value, str) and value.strip():
-            return decrypt_phi(value)
-        return None
+        return self._decrypt(value)
 
 # Use PostgreSQL UUID if available, otherwise use String for SQLite compatibility
 if DATABASE_URL.startswith("sqlite"):
@@ -38,6 +38,18 @@ else:
     def uuid_default():
         return uuid.uuid4()
 
+# Database-side UTC timestamp for high-volume tables, so inserts don't carry a Python-side
+# datetime per row. Columns stay naive UTC like the datetime.utcnow defaults elsewhere.
+if DATABASE_URL.startswith("sqlite"):
+    # CURRENT_TIMESTAMP only has second precision; %f keeps milliseconds for ordering
+    UTC_NOW_SQL = "(strftime('%Y-%m-%d %H:%M:%f', 'now'))"
+    def utc_now():
+        return func.strftime('%Y-%m-%d %H:%M:%f', 'now')
+else:
+    UTC_NOW_SQL = "(now() at time zone 'utc')"
+    def utc_now():
+        return func.timezone('utc', func.now())
+
 
 class User(Base):
     __tablename__ = "users"
@@ -48,8 +60,8 @@ class User(Base):
     full_name = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
     is_verified = Column(Boolean, default=False)
-    verification_token = Column(String, nullable=True)
-    reset_token = Column(String, nullable=True)
+    verification_token = Column(String, nullable=True, index=True)
+    reset_token = Column(String, nullable=True, index=True)
     reset_token_expires = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -68,7 +80,7 @@ class LoginSession(Base):
     id = Column(UUIDType, primary_key=True, default=uuid_default)
     email = Column(String, nullable=False, index=True)
     email_verified_at = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)  # expired sessions are pruned by age
 
 
 class DataSession(Base):
@@ -77,9 +89,13 @@ class DataSession(Base):
     in this session are encrypted with this session's key. User unlocks with password.
     """
     __tablename__ = "data_sessions"
+    __table_args__ = (
+        # Session listing filters by user and sorts newest first
+        Index("ix_data_sessions_user_id_created_at", "user_id", "created_at"),
+    )
 
     id = Column(UUIDType, primary_key=True, default=uuid_default)
-    user_id = Column(UUIDType, ForeignKey("users.id"), nullable=False, index=True)
+    user_id = Column(UUIDType, ForeignKey("users.id"), nullable=False)
     name = Column(String, nullable=False)  # e.g. "Clinical 2024"
     encrypted_encryption_key = Column(String, nullable=False)  # Fernet key encrypted with password-derived key
     key_salt = Column(String, nullable=False)  # salt for deriving key from password
@@ -92,16 +108,21 @@ class DataSession(Base):
 
 class Dataset(Base):
     __tablename__ = "datasets"
+    # Datasets are listed per (session, user); also covers lookups by session_id alone
+    __table_args__ = (
+        Index("ix_datasets_session_id_user_id", "session_id", "user_id"),
+    )
 
     id = Column(UUIDType, primary_key=True, default=uuid_default)
     user_id = Column(UUIDType, ForeignKey("users.id"), nullable=False, index=True)
-    session_id = Column(UUIDType, ForeignKey("data_sessions.id"), nullable=False, index=True)
+    session_id = Column(UUIDType, ForeignKey("data_sessions.id"), nullable=False)
     name = Column(String, nullable=False)
     source_filename = Column(String, nullable=False)
     stored_path = Column(String, nullable=False)
     data_type = Column(String, nullable=True, default="generic")  # e.g., "epsa", "generic", "custom"
     column_map = Column(JSON, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    detected_columns = Column(JSON, nullable=True)  # File headers, saved at upload so they aren't re-read
+    created_at = Column(DateTime, server_default=text(UTC_NOW_SQL))
 
     user = relationship("User", back_populates="datasets")
     data_session = relationship("DataSession", back_populates="datasets")
@@ -110,6 +131,10 @@ class Dataset(Base):
 
 class Patient(Base):
     __tablename__ = "patients"
+    # Patients are looked up by dataset and by (dataset, patient_key); one index serves both
+    __table_args__ = (
+        Index("ix_patients_dataset_id_patient_key", "dataset_id", "patient_key"),
+    )
 
     id = Column(UUIDType, primary_key=True, default=uuid_default)
     dataset_id = Column(UUIDType, ForeignKey("datasets.id"), nullable=False)
@@ -141,7 +166,7 @@ class Patient(Base):
     raw = Column(JSON, nullable=True)
     extra_fields = Column(JSON, nullable=True)
 
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, server_default=text(UTC_NOW_SQL))
+    updated_at = Column(DateTime, server_default=text(UTC_NOW_SQL), onupdate=utc_now())
 
     dataset = relationship("Dataset", back_populates="patients")
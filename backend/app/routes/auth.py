@@ -3,14 +3,16 @@ Authentication routes: register, login, password reset, email verification.
 Session-based login flow: email -> create session (encryption key + OTP) -> verify OTP -> password -> access.
 """
 import uuid
+import hashlib
 import secrets
 import logging
-from datetime import datetime, timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
-from app.db import get_db, DATABASE_URL
-from app.models import User, LoginSession, DataSession
+from app.db import get_db, SessionLocal, DATABASE_URL
+from app.models import User, LoginSession, DataSession, uuid_default
 from app.schemas import (
     UserRegister, UserLogin, Token, UserResponse,
     PasswordResetRequest, PasswordReset, PasswordChange,
@@ -24,10 +26,11 @@ from app.session_store import (
     generate_session_key_encrypted,
     decrypt_session_key,
     put_session_key,
+    refresh_session_key,
 )
 from app.auth import (
-    verify_password, get_password_hash, create_access_token,
-    get_current_active_user
+    verify_password, verify_and_update_password, get_password_hash, create_access_token,
+    get_current_active_user, invalidate_cached_user
 )
 from app.email_service import send_password_reset_email, send_verification_email
 from app.firebase_service import send_firebase_otp
@@ -36,22 +39,68 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 OTP_EXPIRY_MINUTES = 10
+_OTP_TTL = timedelta(minutes=OTP_EXPIRY_MINUTES)
+_RESET_TTL = timedelta(hours=1)
+# /me is per-user: never share it between users, and only reuse it briefly without revalidating
+ME_CACHE_HEADERS = {"Cache-Control": "private, max-age=10", "Vary": "Authorization"}
+
+# Ids are stored as strings on SQLite and as native UUIDs on PostgreSQL
+_IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Verified against when a login names an unknown email
+_DUMMY_HASH = get_password_hash(secrets.token_urlsafe(16))
 
 
 def _session_id_to_uuid(session_id: str):
-    if DATABASE_URL.startswith("sqlite"):
-        return session_id
+    """Parse a client-supplied session id; None if it isn't a UUID (on either dialect)"""
     try:
-        return uuid.UUID(session_id)
-    except (ValueError, TypeError):
+        parsed = uuid.UUID(session_id)
+    except (ValueError, TypeError, AttributeError):
         return None
+    return str(parsed) if _IS_SQLITE else parsed
+
+
+# 192 bits is plenty for single-use links and keeps the indexed token columns short
+TOKEN_BYTES = 24
+
+
+def _utcnow() -> datetime:
+    """Current UTC time as a naive datetime, matching how the DateTime columns store it"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _user_etag(user: User) -> str:
+    """ETag over the fields /me returns"""
+    state = f"{user.id}:{user.email}:{user.full_name}:{user.is_active}:{user.is_verified}:{user.created_at}"
+    return '"' + hashlib.blake2s(state.encode("utf-8"), digest_size=16).hexdigest() + '"'
+
+
+def _new_token() -> str:
+    """Random URL-safe token for email verification and password reset links"""
+    return secrets.token_urlsafe(TOKEN_BYTES)
+
+
+def _prune_login_sessions() -> None:
+    """Delete login sessions older than the OTP window (runs as a background task)"""
+    db = SessionLocal()
+    try:
+        db.execute(delete(LoginSession).where(LoginSession.created_at < _utcnow() - _OTP_TTL))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _send_login_link(email: str) -> None:
+    """Send the Firebase sign-in link (runs as a background task)"""
+    if not send_firebase_otp(email):
+        logger.warning("Firebase sign-in link not sent (check service account key)")
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserRegister, db: Session = Depends(get_db)):
+def register(user_data: UserRegister, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     """Register a new user"""
     # Check if user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email.lower()).first()
+    existing_user = db.query(User).filter(User.email == user_data.email).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -59,11 +108,11 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
         )
     
     # Create verification token
-    verification_token = secrets.token_urlsafe(32)
+    verification_token = _new_token()
     
     # Create new user
     new_user = User(
-        email=user_data.email.lower(),
+        email=user_data.email,
         hashed_password=get_password_hash(user_data.password),
         full_name=user_data.full_name,
         is_active=True,
@@ -75,8 +124,8 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
     db.commit()
     db.refresh(new_user)
     
-    # Send verification email
-    await send_verification_email(new_user.email, verification_token)
+    # Send verification email after the response goes out
+    background_tasks.add_task(send_verification_email, new_user.email, verification_token)
     
     logger.info(f"New user registered: {new_user.email}")
     
@@ -84,7 +133,7 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
 
 
 @router.post("/login", response_model=Token)
-async def login(
+def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
@@ -92,12 +141,19 @@ async def login(
     # Find user by email
     user = db.query(User).filter(User.email == form_data.username.lower()).first()
     
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    # Unknown emails still pay for a hash check, so response time doesn't reveal which accounts exist
+    valid, new_hash = verify_and_update_password(form_data.password, user.hashed_password if user else _DUMMY_HASH)
+    if not user or not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Upgrade a legacy bcrypt hash now that we have the plaintext
+        user.hashed_password = new_hash
+        db.commit()
+        invalidate_cached_user(user.id)
     
     if not user.is_active:
         raise HTTPException(
@@ -106,8 +162,7 @@ async def login(
         )
     
     # Create access token
-    from app.db import DATABASE_URL
-    user_id = str(user.id) if DATABASE_URL.startswith("sqlite") else str(user.id)
+    user_id = str(user.id)
     
     access_token = create_access_token(data={"sub": user_id})
     
@@ -119,14 +174,15 @@ async def login(
 # --- Session-based login: email -> session (key + OTP) -> verify OTP -> password -> access ---
 
 @router.post("/session/start", response_model=SessionStartResponse)
-async def start_login_session(
+def start_login_session(
     body: SessionStartRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
     Step 1: User enters email. Create session, generate encryption key, send OTP to email.
     """
-    email = body.email.lower().strip()
+    email = body.email
     # Require user to exist (login only for registered users)
     user = db.query(User).filter(User.email == email).first()
     if not user:
@@ -140,25 +196,23 @@ async def start_login_session(
             detail="Account is inactive"
         )
 
-    session = LoginSession(email=email)
-    db.add(session)
+    # Assign the id up front so nothing has to be read back after the commit
+    session_id = uuid_default()
+    db.add(LoginSession(id=session_id, email=email))
     db.commit()
-    db.refresh(session)
-
-    session_id = str(session.id)
-    sent = send_firebase_otp(email)
-    if not sent:
-        logger.warning("Firebase sign-in link not sent (check service account key)")
+    # The sign-in link goes out after the response, so it never waits on the commit
+    background_tasks.add_task(_send_login_link, email)
+    background_tasks.add_task(_prune_login_sessions)
 
     logger.info(f"Login session started for {email}")
     return SessionStartResponse(
-        session_id=session_id,
+        session_id=str(session_id),
         message="Check your email for the verification code."
     )
 
 
 @router.post("/session/verify-link", response_model=VerifyOtpResponse)
-async def verify_login_link(
+def verify_login_link(
     body: VerifyOtpRequest, # This will need to be adapted for Firebase link verification
     db: Session = Depends(get_db)
 ):
@@ -171,21 +225,24 @@ async def verify_login_link(
     if sid is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid session")
 
-    session = db.query(LoginSession).filter(LoginSession.id == sid).first()
+    session = db.query(LoginSession).filter(
+        LoginSession.id == sid,
+        LoginSession.created_at >= _utcnow() - _OTP_TTL
+    ).first()
     if not session:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or expired session. Please start again with your email."
         )
 
-    session.email_verified_at = datetime.utcnow()
+    session.email_verified_at = _utcnow()
     db.commit()
     logger.info(f"Email verified for session {body.session_id}")
     return VerifyOtpResponse(verified=True, message="Email verified. Enter your password.")
 
 
 @router.post("/session/complete", response_model=Token)
-async def complete_login(
+def complete_login(
     body: CompleteLoginRequest,
     db: Session = Depends(get_db)
 ):
@@ -197,19 +254,25 @@ async def complete_login(
     if sid is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid session")
 
-    session = db.query(LoginSession).filter(LoginSession.id == sid).first()
-    if not session:
+    # One round trip for the session and its user; the outer join keeps "no such session"
+    # and "no such user" distinguishable
+    row = db.execute(
+        select(LoginSession.email_verified_at, User)
+        .outerjoin(User, User.email == LoginSession.email)
+        .where(LoginSession.id == sid, LoginSession.created_at >= _utcnow() - _OTP_TTL)
+    ).first()
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or expired session. Please start again with your email."
         )
-    if not session.email_verified_at:
+    email_verified_at, user = row
+    if not email_verified_at:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Please verify your email with the code first."
         )
 
-    user = db.query(User).filter(User.email == session.email).first()
     if not user or not user.is_active:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User not found or inactive")
 
@@ -222,20 +285,25 @@ async def complete_login(
 # --- DataSession: list, create, unlock (each session has its own encryption key) ---
 
 @router.get("/data-sessions", response_model=list[DataSessionResponse])
-async def list_data_sessions(
+def list_data_sessions(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """List all data sessions for the current user."""
-    sessions = db.query(DataSession).filter(DataSession.user_id == current_user.id).order_by(DataSession.created_at.desc()).all()
+    # Only the listed columns - skips the key material and password hash on every row
+    rows = db.execute(
+        select(DataSession.id, DataSession.name, DataSession.created_at)
+        .where(DataSession.user_id == current_user.id)
+        .order_by(DataSession.created_at.desc())
+    ).all()
     return [
-        DataSessionResponse(id=str(s.id), name=s.name, created_at=s.created_at)
-        for s in sessions
+        DataSessionResponse(id=str(session_id), name=name, created_at=created_at)
+        for session_id, name, created_at in rows
     ]
 
 
 @router.post("/data-sessions", response_model=DataSessionResponse, status_code=status.HTTP_201_CREATED)
-async def create_data_session(
+def create_data_session(
     body: DataSessionCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
@@ -257,7 +325,7 @@ async def create_data_session(
 
 
 @router.post("/data-sessions/{session_id}/unlock", response_model=Token)
-async def unlock_data_session(
+def unlock_data_session(
     session_id: str,
     body: UnlockSessionRequest,
     db: Session = Depends(get_db),
@@ -275,20 +343,27 @@ async def unlock_data_session(
     if not data_session:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
 
-    if not verify_password(body.password, data_session.unlock_password_hash):
+    valid, new_hash = verify_and_update_password(body.password, data_session.unlock_password_hash)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect password")
+    if new_hash:
+        data_session.unlock_password_hash = new_hash
+        db.commit()
 
-    try:
-        raw_key = decrypt_session_key(
-            body.password,
-            data_session.encrypted_encryption_key,
-            data_session.key_salt,
-        )
-    except Exception as e:
-        logger.error(f"Failed to decrypt session key: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to unlock session")
-
-    put_session_key(str(data_session.id), raw_key)
+    # Already unlocked (e.g. another tab or a re-login): the password checked out above, so
+    # extend the cached key instead of running the PBKDF2 derivation again
+    if not refresh_session_key(str(data_session.id)):
+        try:
+            raw_key = decrypt_session_key(
+                body.password,
+                data_session.encrypted_encryption_key,
+                data_session.key_salt,
+            )
+        except Exception as e:
+            logger.error(f"Failed to decrypt session key: {e}")
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to unlock session")
+
+        put_session_key(str(data_session.id), raw_key)
     user_id = str(current_user.id)
     access_token = create_access_token(data={"sub": user_id}, session_id=str(data_session.id))
     logger.info(f"Session unlocked: {data_session.name} for user {current_user.email}")
@@ -296,16 +371,23 @@ async def unlock_data_session(
 
 
 @router.post("/login-json", response_model=Token)
-async def login_json(user_data: UserLogin, db: Session = Depends(get_db)):
+def login_json(user_data: UserLogin, db: Session = Depends(get_db)):
     """Login using JSON body (alternative to OAuth2 form)"""
-    user = db.query(User).filter(User.email == user_data.email.lower()).first()
+    user = db.query(User).filter(User.email == user_data.email).first()
     
-    if not user or not verify_password(user_data.password, user.hashed_password):
+    # Unknown emails still pay for a hash check, so response time doesn't reveal which accounts exist
+    valid, new_hash = verify_and_update_password(user_data.password, user.hashed_password if user else _DUMMY_HASH)
+    if not user or not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Upgrade a legacy bcrypt hash now that we have the plaintext
+        user.hashed_password = new_hash
+        db.commit()
+        invalidate_cached_user(user.id)
     
     if not user.is_active:
         raise HTTPException(
@@ -313,8 +395,7 @@ async def login_json(user_data: UserLogin, db: Session = Depends(get_db)):
             detail="User account is inactive"
         )
     
-    from app.db import DATABASE_URL
-    user_id = str(user.id) if DATABASE_URL.startswith("sqlite") else str(user.id)
+    user_id = str(user.id)
     
     access_token = create_access_token(data={"sub": user_id})
     
@@ -325,35 +406,43 @@ async def login_json(user_data: UserLogin, db: Session = Depends(get_db)):
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_active_user)
 ):
     """Get current user information"""
+    # The SPA polls this; let clients revalidate with If-None-Match instead of re-downloading
+    headers = {"ETag": _user_etag(current_user), **ME_CACHE_HEADERS}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
     return current_user
 
 
 @router.post("/forgot-password")
-async def forgot_password(
+def forgot_password(
     request: PasswordResetRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Request password reset"""
-    user = db.query(User).filter(User.email == request.email.lower()).first()
+    user = db.query(User).filter(User.email == request.email).first()
     
     # Don't reveal if email exists (security best practice)
     if user:
-        reset_token = secrets.token_urlsafe(32)
+        reset_token = _new_token()
         user.reset_token = reset_token
-        user.reset_token_expires = datetime.utcnow() + timedelta(hours=1)
+        user.reset_token_expires = _utcnow() + _RESET_TTL
         db.commit()
         
-        await send_password_reset_email(user.email, reset_token)
+        background_tasks.add_task(send_password_reset_email, user.email, reset_token)
         logger.info(f"Password reset requested for: {user.email}")
     
     return {"message": "If the email exists, a password reset link has been sent"}
 
 
 @router.post("/reset-password")
-async def reset_password(
+def reset_password(
     reset_data: PasswordReset,
     db: Session = Depends(get_db)
 ):
@@ -366,7 +455,7 @@ async def reset_password(
             detail="Invalid or expired reset token"
         )
     
-    if not user.reset_token_expires or user.reset_token_expires < datetime.utcnow():
+    if not user.reset_token_expires or user.reset_token_expires < _utcnow():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Reset token has expired"
@@ -377,6 +466,7 @@ async def reset_password(
     user.reset_token = None
     user.reset_token_expires = None
     db.commit()
+    invalidate_cached_user(user.id)
     
     logger.info(f"Password reset successful for: {user.email}")
     
@@ -384,7 +474,7 @@ async def reset_password(
 
 
 @router.post("/change-password")
-async def change_password(
+def change_password(
     password_data: PasswordChange,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -398,6 +488,7 @@ async def change_password(
     
     current_user.hashed_password = get_password_hash(password_data.new_password)
     db.commit()
+    invalidate_cached_user(current_user.id)
     
     logger.info(f"Password changed for: {current_user.email}")
     
@@ -405,7 +496,7 @@ async def change_password(
 
 
 @router.get("/verify-email")
-async def verify_email(
+def verify_email(
     token: str,
     db: Session = Depends(get_db)
 ):
@@ -424,6 +515,7 @@ async def verify_email(
     user.is_verified = True
     user.verification_token = None
     db.commit()
+    invalidate_cached_user(user.id)
     
     logger.info(f"Email verified for: {user.email}")
     
@@ -431,12 +523,13 @@ async def verify_email(
 
 
 @router.post("/resend-verification")
-async def resend_verification(
+def resend_verification(
     request: PasswordResetRequest,  # Reuse schema for email
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Resend verification email"""
-    user = db.query(User).filter(User.email == request.email.lower()).first()
+    user = db.query(User).filter(User.email == request.email).first()
     
     if not user:
         # Don't reveal if email exists
@@ -446,10 +539,10 @@ async def resend_verification(
         return {"message": "Email already verified"}
     
     # Generate new verification token
-    verification_token = secrets.token_urlsafe(32)
+    verification_token = _new_token()
     user.verification_token = verification_token
     db.commit()
     
-    await send_verification_email(user.email, verification_token)
+    background_tasks.add_task(send_verification_email, user.email, verification_token)
     
     return {"message": "Verification email sent"}
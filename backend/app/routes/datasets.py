@@ -1,13 +1,16 @@
 import csv
+import re
 import uuid
 import shutil
 import logging
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from app.db import get_db
+from app.db import get_db, DATABASE_URL
 from app.models import Dataset, Patient, User, DataSession
 from app.auth import get_current_session
 from typing import Tuple
@@ -17,14 +20,16 @@ from app.data.column_matcher import suggest_column_mappings, auto_map_columns
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Ids are stored as strings on SQLite and as native UUIDs on PostgreSQL
+_IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
 
 def get_user_dataset(dataset_id: uuid.UUID, db: Session, user: User, data_session: DataSession) -> Dataset:
     """Get a dataset and verify it belongs to the current user and current session."""
-    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+    dataset = db.query(Dataset).filter(Dataset.id == (str(dataset_id) if _IS_SQLITE else dataset_id)).first()
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
-    from app.db import DATABASE_URL
-    if DATABASE_URL.startswith("sqlite"):
+    if _IS_SQLITE:
         if str(dataset.user_id) != str(user.id) or str(dataset.session_id) != str(data_session.id):
             raise HTTPException(status_code=403, detail="Access denied")
     else:
@@ -50,19 +55,42 @@ def parse_date_string(date_str: str) -> Optional[datetime]:
     if not date_str:
         return None
     
-    # Try common date formats first
-    date_formats = [
-        '%m/%d/%Y',      # 3/10/2025 or 03/10/2025
-        '%m-%d-%Y',      # 3-10-2025
-        '%d/%m/%Y',      # 10/3/2025 (European)
-        '%d-%m-%Y',      # 10-3-2025
-        '%Y-%m-%d',      # 2025-03-10 (ISO)
-        '%Y/%m/%d',      # 2025/03/10
-        '%m/%d/%y',      # 3/10/25
-        '%d/%m/%y',      # 10/3/25
-        '%Y-%m-%d %H:%M:%S',  # ISO with time
-        '%m/%d/%Y %H:%M:%S',  # US format with time
-    ]
+    # Date columns repeat the same few values across many rows, so parse each distinct one once
+    return _parse_date_cached(date_str)
+
+# Common date formats, tried in this order
+DATE_FORMATS = [
+    '%m/%d/%Y',      # 3/10/2025 or 03/10/2025
+    '%m-%d-%Y',      # 3-10-2025
+    '%d/%m/%Y',      # 10/3/2025 (European)
+    '%d-%m-%Y',      # 10-3-2025
+    '%Y-%m-%d',      # 2025-03-10 (ISO)
+    '%Y/%m/%d',      # 2025/03/10
+    '%m/%d/%y',      # 3/10/25
+    '%d/%m/%y',      # 10/3/25
+    '%Y-%m-%d %H:%M:%S',  # ISO with time
+    '%m/%d/%Y %H:%M:%S',  # US format with time
+]
+
+# Shape of the string -> the only formats above that can match it, in the same order.
+# Anything that fits none of these shapes goes through the full list.
+DATE_FORMAT_SHORTLISTS = [
+    (re.compile(r'\d{1,2}/\d{1,2}/\d{4}'), ['%m/%d/%Y', '%d/%m/%Y']),
+    (re.compile(r'\d{1,2}-\d{1,2}-\d{4}'), ['%m-%d-%Y', '%d-%m-%Y']),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2}'), ['%Y-%m-%d']),
+    (re.compile(r'\d{4}/\d{1,2}/\d{1,2}'), ['%Y/%m/%d']),
+    (re.compile(r'\d{1,2}/\d{1,2}/\d{2}'), ['%m/%d/%y', '%d/%m/%y']),
+    (re.compile(r'\d{4}-\d{1,2}-\d{1,2} \d{1,2}:\d{1,2}:\d{1,2}'), ['%Y-%m-%d %H:%M:%S']),
+    (re.compile(r'\d{1,2}/\d{1,2}/\d{4} \d{1,2}:\d{1,2}:\d{1,2}'), ['%m/%d/%Y %H:%M:%S']),
+]
+
+@lru_cache(maxsize=16384)
+def _parse_date_cached(date_str: str) -> Optional[datetime]:
+    date_formats = DATE_FORMATS
+    for pattern, shortlist in DATE_FORMAT_SHORTLISTS:
+        if pattern.fullmatch(date_str):
+            date_formats = shortlist
+            break
     
     # Try parsing with specific formats first
     for fmt in date_formats:
@@ -82,9 +110,30 @@ def parse_date_string(date_str: str) -> Optional[datetime]:
         logger.warning(f"Could not parse date string (dateutil not available): {date_str}")
         return None
 
+def parse_date_column(values: List[Any]) -> Optional[List[Optional[datetime]]]:
+    """Parse a whole column of date strings in one vectorized pass.
+    Returns None when pandas isn't available or can't give a single datetime column
+    (e.g. mixed timezones); callers then fall back to parse_date_string per value."""
+    if not PANDAS_AVAILABLE:
+        return None
+    try:
+        # format='mixed' infers each value on its own (month-first, like parse_date_string);
+        # cache=True parses each distinct string once
+        parsed = pd.to_datetime(pd.Series(values, dtype=object), errors="coerce", format="mixed", cache=True)
+    except (ValueError, TypeError):
+        return None
+    if not pd.api.types.is_datetime64_any_dtype(parsed):
+        return None
+    if parsed.dt.tz is not None:
+        return [None if pd.isna(ts) else ts.to_pydatetime() for ts in parsed]
+    # Microsecond datetime64 converts straight to datetime objects, with NaT becoming None
+    return parsed.to_numpy(dtype="datetime64[us]").tolist()
+
 # Upload directory
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
+# Uploads are copied to disk in 4 MiB chunks rather than shutil's default 64 KiB
+UPLOAD_COPY_BUFFER_SIZE = 4 * 1024 * 1024
 
 # Try to import pandas for Excel support
 try:
@@ -93,9 +142,106 @@ try:
 except ImportError:
     PANDAS_AVAILABLE = False
 
+# Try to import pyarrow for fast CSV parsing (falls back to the csv module)
+try:
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+def read_csv_headers(file_path) -> List[str]:
+    """Read only the header row of a CSV file (UTF-8, falling back to latin-1)"""
+    with open(file_path, "rb") as f:
+        raw = f.readline()
+        # A quoted header can contain newlines; keep reading until the quotes balance
+        while raw.count(b'"') % 2:
+            more = f.readline()
+            if not more:
+                break
+            raw += more
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        text = raw.decode("latin-1")
+    return next(csv.reader(text.splitlines(keepends=True)), [])
+
+
+def _read_csv_rows_arrow(file_path, columns: List[str], encoding: str) -> List[Dict[str, Any]]:
+    """Parse a CSV with Arrow, keeping every cell as text like csv.DictReader does"""
+    table = pa_csv.read_csv(
+        file_path,
+        # Name the columns from read_csv_headers so they match DictReader exactly (incl. any BOM);
+        # the header row then comes back as the first data row and is dropped
+        read_options=pa_csv.ReadOptions(column_names=columns, encoding=encoding),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in columns},
+            strings_can_be_null=False,
+            quoted_strings_can_be_null=False,
+        ),
+    ).slice(1)
+    # Converting column by column through pandas is several times cheaper than Table.to_pylist()
+    values = [column.to_pandas().tolist() for column in table.columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def read_csv_rows(file_path) -> List[Dict[str, Any]]:
+    """Read all rows of a CSV as dicts (UTF-8, falling back to latin-1)"""
+    if PYARROW_AVAILABLE and PANDAS_AVAILABLE:
+        columns = read_csv_headers(file_path)
+        # Duplicate names collapse differently in Arrow than in DictReader; leave those to csv
+        if columns and len(set(columns)) == len(columns):
+            for encoding in ("utf8", "latin1"):
+                try:
+                    return _read_csv_rows_arrow(file_path, columns, encoding)
+                except pa.ArrowInvalid:
+                    # Not valid in this encoding, or ragged rows that only DictReader tolerates
+                    continue
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+    except UnicodeDecodeError:
+        with open(file_path, "r", encoding="latin-1") as f:
+            return list(csv.DictReader(f))
+
+
+def get_detected_columns(dataset: Dataset, db: Session) -> List[str]:
+    """Column headers of a dataset's file. They're stored on the dataset at upload;
+    datasets from before that are read from the file once and backfilled."""
+    if dataset.detected_columns is not None:
+        return dataset.detected_columns
+    
+    file_path = Path(dataset.stored_path)
+    filename_lower = file_path.name.lower()
+    is_excel = filename_lower.endswith('.xlsx') or filename_lower.endswith('.xls')
+    
+    columns = []
+    if is_excel:
+        if not PANDAS_AVAILABLE:
+            raise HTTPException(
+                status_code=400,
+                detail="Excel file support requires pandas. Please install: pip install pandas openpyxl"
+            )
+        try:
+            df = pd.read_excel(file_path, nrows=0)
+            columns = df.columns.tolist()
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not read Excel file: {str(e)}")
+    else:
+        try:
+            columns = read_csv_headers(file_path)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Could not read CSV file: {str(e)}")
+    
+    dataset.detected_columns = columns
+    db.commit()
+    return columns
+
 
 @router.post("/upload", response_model=DatasetResponse)
-async def upload_dataset(
+def upload_dataset(
     file: UploadFile = File(...),
     data_type: str = Query("generic", description="Type of data: 'epsa', 'generic', or 'custom'"),
     db: Session = Depends(get_db),
@@ -123,7 +269,7 @@ async def upload_dataset(
         UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
         
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            shutil.copyfileobj(file.file, buffer, UPLOAD_COPY_BUFFER_SIZE)
         
         # Read file to detect columns
         columns = []
@@ -145,20 +291,12 @@ async def upload_dataset(
         else:
             # Read CSV file
             try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    reader = csv.DictReader(f)
-                    columns = reader.fieldnames or []
-            except UnicodeDecodeError:
-                # Try with different encoding
-                try:
-                    with open(file_path, "r", encoding="latin-1") as f:
-                        reader = csv.DictReader(f)
-                        columns = reader.fieldnames or []
-                except Exception as e:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Could not read CSV file: {str(e)}"
-                    )
+                columns = read_csv_headers(file_path)
+            except Exception as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Could not read CSV file: {str(e)}"
+                )
         
         if not columns:
             raise HTTPException(
@@ -173,7 +311,8 @@ async def upload_dataset(
             name=file.filename,
             source_filename=file.filename,
             stored_path=str(file_path),
-            data_type=data_type
+            data_type=data_type,
+            detected_columns=columns
         )
         db.add(dataset)
         db.commit()
@@ -191,7 +330,7 @@ async def upload_dataset(
 
 
 @router.get("/{dataset_id}/columns", response_model=DetectedColumnsResponse)
-async def get_dataset_columns(
+def get_dataset_columns(
     dataset_id: uuid.UUID,
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
@@ -199,41 +338,12 @@ async def get_dataset_columns(
     """Get detected columns from uploaded CSV/Excel file"""
     current_user, data_session = session_context
     dataset = get_user_dataset(dataset_id, db, current_user, data_session)
-    
-    file_path = Path(dataset.stored_path)
-    filename_lower = file_path.name.lower()
-    is_excel = filename_lower.endswith('.xlsx') or filename_lower.endswith('.xls')
-    
-    columns = []
-    if is_excel:
-        if not PANDAS_AVAILABLE:
-            raise HTTPException(
-                status_code=400,
-                detail="Excel file support requires pandas. Please install: pip install pandas openpyxl"
-            )
-        try:
-            df = pd.read_excel(file_path, nrows=0)
-            columns = df.columns.tolist()
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Could not read Excel file: {str(e)}")
-    else:
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                columns = list(reader.fieldnames or [])
-        except UnicodeDecodeError:
-            try:
-                with open(file_path, "r", encoding="latin-1") as f:
-                    reader = csv.DictReader(f)
-                    columns = list(reader.fieldnames or [])
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Could not read CSV file: {str(e)}")
-    
+    columns = get_detected_columns(dataset, db)
     return DetectedColumnsResponse(columns=columns)
 
 
 @router.get("/{dataset_id}/suggest-mappings")
-async def suggest_column_mappings_endpoint(
+def suggest_column_mappings_endpoint(
     dataset_id: uuid.UUID,
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
@@ -243,34 +353,7 @@ async def suggest_column_mappings_endpoint(
     dataset = get_user_dataset(dataset_id, db, current_user, data_session)
     
     # Get columns
-    file_path = Path(dataset.stored_path)
-    filename_lower = file_path.name.lower()
-    is_excel = filename_lower.endswith('.xlsx') or filename_lower.endswith('.xls')
-    
-    columns = []
-    if is_excel:
-        if not PANDAS_AVAILABLE:
-            raise HTTPException(
-                status_code=400,
-                detail="Excel file support requires pandas. Please install: pip install pandas openpyxl"
-            )
-        try:
-            df = pd.read_excel(file_path, nrows=0)
-            columns = df.columns.tolist()
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Could not read Excel file: {str(e)}")
-    else:
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                columns = list(reader.fieldnames or [])
-        except UnicodeDecodeError:
-            try:
-                with open(file_path, "r", encoding="latin-1") as f:
-                    reader = csv.DictReader(f)
-                    columns = list(reader.fieldnames or [])
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Could not read CSV file: {str(e)}")
+    columns = get_detected_columns(dataset, db)
     
     # Get existing mapping if any
     existing_mapping = dataset.column_map or {}
@@ -299,7 +382,7 @@ async def suggest_column_mappings_endpoint(
 
 
 @router.post("/{dataset_id}/map", response_model=dict)
-async def map_columns(
+def map_columns(
     dataset_id: uuid.UUID,
     mapping: ColumnMappingRequest,
     db: Session = Depends(get_db),
@@ -320,45 +403,14 @@ async def map_columns(
     filename_lower = file_path.name.lower()
     is_excel = filename_lower.endswith('.xlsx') or filename_lower.endswith('.xls')
     
+    if is_excel and not PANDAS_AVAILABLE:
+        raise HTTPException(
+            status_code=400,
+            detail="Excel file support requires pandas. Please install: pip install pandas openpyxl"
+        )
+    
     # Get available columns first to validate mappings
-    available_columns = []
-    if is_excel:
-        if not PANDAS_AVAILABLE:
-            raise HTTPException(
-                status_code=400,
-                detail="Excel file support requires pandas. Please install: pip install pandas openpyxl"
-            )
-        try:
-            df = pd.read_excel(file_path, nrows=0)
-            available_columns = df.columns.tolist()
-        except Exception as e:
-            logger.error(f"Error reading Excel headers: {e}", exc_info=True)
-            raise HTTPException(
-                status_code=400,
-                detail=f"Could not read Excel file headers: {str(e)}"
-            )
-    else:
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                available_columns = list(reader.fieldnames or [])
-        except UnicodeDecodeError:
-            try:
-                with open(file_path, "r", encoding="latin-1") as f:
-                    reader = csv.DictReader(f)
-                    available_columns = list(reader.fieldnames or [])
-            except Exception as e:
-                logger.error(f"Error reading CSV headers: {e}", exc_info=True)
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Could not read CSV file headers: {str(e)}"
-                )
-        except Exception as e:
-            logger.error(f"Error reading CSV headers: {e}", exc_info=True)
-            raise HTTPException(
-                status_code=400,
-                detail=f"Could not read CSV file headers: {str(e)}"
-            )
+    available_columns = get_detected_columns(dataset, db)
     
     # Validate that all mapped columns exist in the file
     invalid_columns = []
@@ -380,7 +432,8 @@ async def map_columns(
         # Read full Excel file
         try:
             df = pd.read_excel(file_path)
-            rows = df.to_dict('records')
+            # Turn NaN/NaT into None once for the whole frame so the row loop never checks cells
+            rows = df.astype(object).where(pd.notna(df), None).to_dict('records')
         except Exception as e:
             logger.error(f"Error reading Excel file: {e}", exc_info=True)
             raise HTTPException(
@@ -390,20 +443,7 @@ async def map_columns(
     else:
         # Read full CSV file
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                rows = list(reader)
-        except UnicodeDecodeError:
-            try:
-                with open(file_path, "r", encoding="latin-1") as f:
-                    reader = csv.DictReader(f)
-                    rows = list(reader)
-            except Exception as e:
-                logger.error(f"Error reading CSV file with latin-1 encoding: {e}", exc_info=True)
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Could not read CSV file: {str(e)}"
-                )
+            rows = read_csv_rows(file_path)
         except Exception as e:
             logger.error(f"Error reading CSV file: {e}", exc_info=True)
             raise HTTPException(
@@ -411,66 +451,70 @@ async def map_columns(
                 detail=f"Could not read CSV file: {str(e)}"
             )
     
+    # Get all canonical fields from PatientCreate schema
+    metadata_fields = {"dataset_id", "patient_key", "raw", "extra_fields", "id", "created_at", "updated_at", "missing_fields", "imputed_fields"}
+    all_canonical_fields = [f for f in PatientCreate.model_fields if f not in metadata_fields]
+    
+    # Define field types for proper conversion
+    numeric_float_fields = {"points", "percent"}
+    numeric_int_fields = set()
+    boolean_fields = {"pca_confirmed"}
+    datetime_fields = {"date_of_service"}
+    string_fields = {"mrn", "first_name", "last_name", "location", "reason_for_visit", "age_group", "race", "family_history", "genetic_mutation", "gleason_grade", "category"}
+    
+    # Canonical fields that are mapped to a column, in schema order
+    field_to_col = {f: mapping.column_map[f] for f in all_canonical_fields if mapping.column_map.get(f)}
+    
+    # Extract extra fields: CSV columns that aren't mapped to canonical fields
+    mapped_csv_columns = set(mapping.column_map.values())
+    
+    # If create_extra_fields is provided, add those mappings to mapped_csv_columns
+    if hasattr(mapping, 'create_extra_fields') and mapping.create_extra_fields:
+        mapped_csv_columns.update(mapping.create_extra_fields.keys())
+    
+    # CSV dates are plain strings: parse each mapped date column in one pass up front
+    parsed_dates = {}
+    if not is_excel:
+        for canonical_field in datetime_fields:
+            csv_column = field_to_col.get(canonical_field)
+            if csv_column:
+                column_values = parse_date_column([row.get(csv_column) for row in rows])
+                if column_values is not None:
+                    parsed_dates[canonical_field] = column_values
+    
+    # Load the dataset's patients once and match rows in memory instead of querying per row.
+    # Only patients already in the database are matched; rows in this file are never merged.
+    patients = db.query(Patient).filter(Patient.dataset_id == dataset.id).all()
+    patient_by_key = {p.patient_key: p for p in patients}
+    patient_by_mrn = {}
+    for p in patients:
+        if p.mrn:
+            patient_by_mrn.setdefault(p.mrn, p)
+    new_patients = []
+    
     for row_idx, row in enumerate(rows):
-        # Store raw data
-        raw_data = {}
-        for key, value in row.items():
-            # Handle pandas Timestamp objects
-            if PANDAS_AVAILABLE:
-                try:
-                    if isinstance(value, pd.Timestamp):
-                        raw_data[key] = value.isoformat()
-                        continue
-                    elif pd.isna(value):
-                        raw_data[key] = None
-                        continue
-                except (AttributeError, TypeError):
-                    pass
-            
-            # Store other values as-is
-            raw_data[key] = value
+        # Store raw data (missing cells are already None; CSV cells are plain strings)
+        if is_excel:
+            raw_data = {key: value.isoformat() if isinstance(value, pd.Timestamp) else value for key, value in row.items()}
+        else:
+            raw_data = dict(row)
         
         # Map CSV/Excel columns to canonical fields
         patient_data = {
-            "dataset_id": dataset_id,
+            "dataset_id": dataset.id,
             "patient_key": str(row_idx + 1),  # Use row number as key
             "raw": raw_data
         }
         
-        # Get all canonical fields from PatientCreate schema
-        metadata_fields = {"dataset_id", "patient_key", "raw", "extra_fields", "id", "created_at", "updated_at", "missing_fields", "imputed_fields"}
-        schema_fields = set(PatientCreate.model_fields.keys())
-        all_canonical_fields = [f for f in schema_fields if f not in metadata_fields]
-        
-        # Define field types for proper conversion
-        numeric_float_fields = ["points", "percent"]
-        numeric_int_fields = []
-        boolean_fields = ["pca_confirmed"]
-        datetime_fields = ["date_of_service"]
-        string_fields = ["mrn", "first_name", "last_name", "location", "reason_for_visit", "age_group", "race", "family_history", "genetic_mutation", "gleason_grade", "category"]
-        
         # Initialize all canonical fields to None first
         for canonical_field in all_canonical_fields:
             if canonical_field not in patient_data:
                 patient_data[canonical_field] = None
         
         # Now populate fields that exist in the mapping and CSV
-        for canonical_field in all_canonical_fields:
-            csv_column = mapping.column_map.get(canonical_field)
-            if csv_column and csv_column in row:
+        for canonical_field, csv_column in field_to_col.items():
+            if csv_column in row:
                 value = row[csv_column]
-                # Handle pandas NaN values and None
-                if value is None:
-                    value = None
-                elif PANDAS_AVAILABLE:
-                    try:
-                        if pd.isna(value):
-                            value = None
-                    except (AttributeError, TypeError):
-                        pass
-                # Check for NaN-like float values
-                elif isinstance(value, float) and value != value:  # NaN check
-                    value = None
                 # Try to convert to appropriate type
                 if canonical_field in numeric_float_fields:
                     try:
@@ -493,7 +537,9 @@ async def map_columns(
                     else:
                         value = None
                 elif canonical_field in datetime_fields:
-                    if value is None:
+                    if canonical_field in parsed_dates:
+                        value = parsed_dates[canonical_field][row_idx]
+                    elif value is None:
                         value = None
                     elif isinstance(value, datetime):
                         # Already a datetime object
@@ -538,13 +584,6 @@ async def map_columns(
                 
                 patient_data[canonical_field] = value
         
-        # Extract extra fields: CSV columns that aren't mapped to canonical fields
-        mapped_csv_columns = set(mapping.column_map.values())
-        
-        # If create_extra_fields is provided, add those mappings to mapped_csv_columns
-        if hasattr(mapping, 'create_extra_fields') and mapping.create_extra_fields:
-            mapped_csv_columns.update(mapping.create_extra_fields.keys())
-        
         extra_fields = {}
         
         # First, handle explicitly created extra_fields (from create_extra_fields mapping)
@@ -554,16 +593,7 @@ async def map_columns(
                     value = row[csv_column]
                     if value is not None:
                         if PANDAS_AVAILABLE:
-                            try:
-                                if pd.isna(value):
-                                    continue
-                                elif isinstance(value, pd.Timestamp):
-                                    cleaned_value = value.isoformat()
-                                else:
-                                    cleaned_value = value
-                                extra_fields[custom_field_name] = cleaned_value
-                            except (AttributeError, TypeError):
-                                extra_fields[custom_field_name] = str(value).strip() if value else None
+                            extra_fields[custom_field_name] = value.isoformat() if isinstance(value, pd.Timestamp) else value
                         else:
                             extra_fields[custom_field_name] = str(value).strip() if value else None
         
@@ -575,19 +605,15 @@ async def map_columns(
             if value is None:
                 continue
             elif PANDAS_AVAILABLE:
-                try:
-                    if pd.isna(value):
-                        continue
-                    elif isinstance(value, pd.Timestamp):
-                        cleaned_value = value.isoformat()
-                    else:
-                        cleaned_value = value
-                    extra_fields[csv_column] = cleaned_value
-                except (AttributeError, TypeError):
-                    extra_fields[csv_column] = str(value).strip() if value else None
+                extra_fields[csv_column] = value.isoformat() if isinstance(value, pd.Timestamp) else value
             else:
                 extra_fields[csv_column] = str(value).strip() if value else None
         
+        # Check if patient already exists
+        existing_patient = patient_by_key.get(patient_data["patient_key"])
+        if not existing_patient and patient_data.get("mrn"):
+            existing_patient = patient_by_mrn.get(patient_data["mrn"])
+        
         # Merge with existing extra_fields if updating existing patient
         if existing_patient and existing_patient.extra_fields:
             existing_extra = existing_patient.extra_fields.copy()
@@ -596,18 +622,6 @@ async def map_columns(
         
         patient_data["extra_fields"] = extra_fields if extra_fields else None
         
-        # Check if patient already exists
-        existing_patient = db.query(Patient).filter(
-            Patient.dataset_id == dataset_id,
-            Patient.patient_key == patient_data["patient_key"]
-        ).first()
-        
-        if not existing_patient and patient_data.get("mrn"):
-            existing_patient = db.query(Patient).filter(
-                Patient.dataset_id == dataset_id,
-                Patient.mrn == patient_data["mrn"]
-            ).first()
-        
         if existing_patient:
             # Update only missing/blank fields
             updated = False
@@ -641,22 +655,14 @@ async def map_columns(
                 existing_patient.updated_at = datetime.utcnow()
                 patients_updated += 1
         else:
-            # Create new patient record
-            try:
-                patient = PatientCreate(**patient_data)
-                db_patient = Patient(**patient.model_dump())
-                db.add(db_patient)
-                patients_created += 1
-            except Exception as e:
-                logger.error(f"Error creating patient record for row {row_idx + 1}: {e}", exc_info=True)
-                logger.error(f"Patient data: {patient_data}")
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Error creating patient record for row {row_idx + 1}: {str(e)}"
-                )
+            # New patients are inserted together after the loop; values are already converted
+            new_patients.append(patient_data)
+            patients_created += 1
     
     # Save column map to dataset
     try:
+        if new_patients:
+            db.execute(insert(Patient), new_patients)
         dataset.column_map = mapping.column_map
         db.commit()
     except Exception as e:
@@ -683,7 +689,7 @@ async def map_columns(
 
 
 @router.get("/{dataset_id}", response_model=DatasetResponse)
-async def get_dataset(
+def get_dataset(
     dataset_id: uuid.UUID,
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
@@ -712,7 +718,7 @@ async def get_dataset(
 
 
 @router.get("", response_model=List[DatasetResponse])
-async def list_datasets(
+def list_datasets(
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
 ):
@@ -747,7 +753,7 @@ async def list_datasets(
 
 
 @router.get("/{dataset_id}/reprocess-check", response_model=ReprocessCheckResponse)
-async def reprocess_check(
+def reprocess_check(
     dataset_id: uuid.UUID,
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
@@ -897,7 +903,7 @@ async def reprocess_check(
 
 
 @router.post("/{dataset_id}/add-unmapped-to-extra-fields")
-async def add_unmapped_to_extra_fields(
+def add_unmapped_to_extra_fields(
     dataset_id: uuid.UUID,
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
@@ -1025,7 +1031,7 @@ async def add_unmapped_to_extra_fields(
 
 
 @router.post("/{dataset_id}/reprocess-update")
-async def reprocess_update(
+def reprocess_update(
     dataset_id: uuid.UUID,
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
@@ -1197,7 +1203,7 @@ async def reprocess_update(
 
 
 @router.delete("/{dataset_id}")
-async def delete_dataset(
+def delete_dataset(
     dataset_id: uuid.UUID,
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
@@ -1236,7 +1242,7 @@ async def delete_dataset(
 
 
 @router.get("/{dataset_id}/raw-data")
-async def get_raw_data(
+def get_raw_data(
     dataset_id: uuid.UUID,
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
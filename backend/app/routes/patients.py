@@ -1,8 +1,8 @@
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Request
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from app.db import get_db
+from sqlalchemy import or_, insert
+from app.db import get_db, DATABASE_URL
 from app.models import Patient, Dataset, User, DataSession
 from app.auth import get_current_session
 from typing import Tuple
@@ -19,17 +19,22 @@ from datetime import datetime
 
 router = APIRouter()
 
+# New patients from an uploaded file are inserted in batches of this many rows
+PATIENT_INSERT_BATCH_SIZE = 1000
+
+# Ids are stored as strings on SQLite and as native UUIDs on PostgreSQL
+_IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
 
 def get_user_dataset_for_patient(dataset_id, db: Session, user: User, data_session: DataSession) -> Dataset:
     """Get a dataset and verify it belongs to the current user and current session (for patient routes)."""
-    from app.db import DATABASE_URL
-    if DATABASE_URL.startswith("sqlite"):
+    if _IS_SQLITE:
         dataset = db.query(Dataset).filter(Dataset.id == str(dataset_id)).first()
     else:
         dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
-    if DATABASE_URL.startswith("sqlite"):
+    if _IS_SQLITE:
         if str(dataset.user_id) != str(user.id) or str(dataset.session_id) != str(data_session.id):
             raise HTTPException(status_code=403, detail="Access denied")
     else:
@@ -40,8 +45,7 @@ def get_user_dataset_for_patient(dataset_id, db: Session, user: User, data_sessi
 
 def get_user_patient(patient_id, db: Session, user: User, data_session: DataSession) -> Patient:
     """Get a patient and verify it belongs to the current user and session through its dataset."""
-    from app.db import DATABASE_URL
-    if DATABASE_URL.startswith("sqlite"):
+    if _IS_SQLITE:
         patient = db.query(Patient).filter(Patient.id == str(patient_id)).first()
     else:
         patient = db.query(Patient).filter(Patient.id == patient_id).first()
@@ -50,7 +54,7 @@ def get_user_patient(patient_id, db: Session, user: User, data_session: DataSess
     dataset = db.query(Dataset).filter(Dataset.id == patient.dataset_id).first()
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
-    if DATABASE_URL.startswith("sqlite"):
+    if _IS_SQLITE:
         if str(dataset.user_id) != str(user.id) or str(dataset.session_id) != str(data_session.id):
             raise HTTPException(status_code=403, detail="Access denied")
     else:
@@ -60,7 +64,7 @@ def get_user_patient(patient_id, db: Session, user: User, data_session: DataSess
 
 
 @router.get("/dataset/{dataset_id}", response_model=PaginatedResponse)
-async def list_patients(
+def list_patients(
     dataset_id: UUID,
     request: Request,
     search: Optional[str] = Query(None),
@@ -125,7 +129,7 @@ async def list_patients(
 
 
 @router.post("", response_model=PatientResponse)
-async def create_patient(
+def create_patient(
     patient_create: PatientCreate,
     request: Request,
     db: Session = Depends(get_db),
@@ -181,7 +185,7 @@ async def create_patient(
 
 
 @router.get("/all", response_model=PaginatedResponse)
-async def list_all_patients(
+def list_all_patients(
     request: Request,
     search: Optional[str] = Query(None),
     limit: int = Query(100, ge=1, le=1000),
@@ -265,7 +269,7 @@ async def list_all_patients(
 
 
 @router.patch("/bulk-update")
-async def bulk_update_patients(
+def bulk_update_patients(
     updates: List[Dict[str, Any]],
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
@@ -315,7 +319,7 @@ async def bulk_update_patients(
 
 
 @router.get("/{patient_id}", response_model=PatientResponse)
-async def get_patient(
+def get_patient(
     patient_id: UUID,
     request: Request,
     db: Session = Depends(get_db),
@@ -343,7 +347,7 @@ async def get_patient(
 
 
 @router.patch("/{patient_id}", response_model=PatientResponse)
-async def update_patient(
+def update_patient(
     patient_id: UUID,
     patient_update: PatientUpdate,
     request: Request,
@@ -415,7 +419,7 @@ async def update_patient(
 
 
 @router.post("/dataset/{dataset_id}/fill")
-async def fill_missing_data(
+def fill_missing_data(
     dataset_id: UUID,
     fill_request: FillRequest,
     db: Session = Depends(get_db),
@@ -431,7 +435,7 @@ async def fill_missing_data(
 
 
 @router.get("/dataset/{dataset_id}/missingness")
-async def get_missingness_summary(
+def get_missingness_summary(
     dataset_id: UUID,
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
@@ -467,7 +471,7 @@ async def get_missingness_summary(
 
 
 @router.post("/upload-file")
-async def upload_file_to_update_patients(
+def upload_file_to_update_patients(
     file: UploadFile = File(...),
     match_by_mrn: bool = Query(True, description="Match existing patients by MRN"),
     db: Session = Depends(get_db),
@@ -548,8 +552,19 @@ async def upload_file_to_update_patients(
     
     # Auto-map columns using generic data type for Data Manager uploads
     existing_mapping = {}
+    suggestions = suggest_column_mappings(columns, existing_mapping, data_type="generic")
     auto_mapped = auto_map_columns(columns, existing_mapping, min_confidence=0.7, data_type="generic")
     
+    # New patients are collected as plain dicts and inserted with one executemany per batch,
+    # skipping the unit of work. Keyed by patient_key so a key repeated in the file (before
+    # its batch is written) updates the pending row instead of creating a duplicate.
+    pending_patients: Dict[str, Dict[str, Any]] = {}
+    
+    def insert_pending_patients():
+        if pending_patients:
+            db.execute(insert(Patient), list(pending_patients.values()))
+            pending_patients.clear()
+    
     for row_idx, row in enumerate(rows):
         # Store raw data
         raw_data = {}
@@ -591,7 +606,8 @@ async def upload_file_to_update_patients(
             ).first()
         
         # If not found by MRN, try patient_key in default dataset
-        if not existing_patient:
+        pending_patient = pending_patients.get(patient_key) if not existing_patient else None
+        if not existing_patient and pending_patient is None:
             existing_patient = db.query(Patient).filter(
                 Patient.dataset_id == default_dataset.id,
                 Patient.patient_key == patient_key
@@ -683,9 +699,8 @@ async def upload_file_to_update_patients(
         if mrn_value:
             patient_data["mrn"] = mrn_value
         
-        # Set extra_fields
-        if extra_fields_data:
-            patient_data["extra_fields"] = extra_fields_data
+        # Always set, so every dict in a batched insert has the same keys
+        patient_data["extra_fields"] = extra_fields_data or None
         
         # Update existing or create new
         if existing_patient:
@@ -704,15 +719,27 @@ async def upload_file_to_update_patients(
             existing_patient.raw = raw_data
             existing_patient.updated_at = datetime.utcnow()
             patients_updated += 1
+        elif pending_patient is not None:
+            # Same key earlier in this file and not written yet - update it in place
+            for field, value in patient_data.items():
+                if field not in ["dataset_id", "patient_key", "raw", "extra_fields"] and value is not None:
+                    pending_patient[field] = value
+            if extra_fields_data:
+                pending_patient["extra_fields"] = {**(pending_patient.get("extra_fields") or {}), **extra_fields_data}
+            pending_patient["raw"] = raw_data
+            patients_updated += 1
         else:
             # Create new patient
-            new_patient = Patient(**patient_data)
-            db.add(new_patient)
+            pending_patients[patient_key] = patient_data
             patients_created += 1
+            if len(pending_patients) >= PATIENT_INSERT_BATCH_SIZE:
+                insert_pending_patients()
+                db.commit()
         
         if (row_idx + 1) % 100 == 0:
             db.commit()
     
+    insert_pending_patients()
     db.commit()
     
     return {
@@ -727,7 +754,7 @@ async def upload_file_to_update_patients(
 
 
 @router.post("/add-custom-field")
-async def add_custom_field_to_patients(
+def add_custom_field_to_patients(
     field_name: str = Query(..., description="Name of the custom field to add"),
     default_value: Optional[str] = Query(None, description="Default value for existing patients"),
     db: Session = Depends(get_db),
@@ -772,7 +799,7 @@ async def add_custom_field_to_patients(
 
 
 @router.delete("/remove-custom-field")
-async def remove_custom_field_from_patients(
+def remove_custom_field_from_patients(
     field_name: str = Query(..., description="Name of the custom field to remove"),
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
@@ -809,7 +836,7 @@ async def remove_custom_field_from_patients(
 
 
 @router.get("/custom-fields")
-async def get_custom_fields(
+def get_custom_fields(
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
 ):
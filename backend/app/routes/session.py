@@ -21,7 +21,7 @@ UPLOAD_DIR = Path("uploads")
 
 
 @router.delete("/clear-all")
-async def clear_all_data(
+def clear_all_data(
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
 ):
@@ -85,7 +85,7 @@ async def clear_all_data(
 
 
 @router.get("/stats")
-async def get_session_stats(
+def get_session_stats(
     db: Session = Depends(get_db),
     session_context: Tuple[User, DataSession] = Depends(get_current_session),
 ):
@@ -1,6 +1,6 @@
-from typing import Optional, List, Dict, Any
+from typing import Annotated, Optional, List, Dict, Any
 from datetime import datetime
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, StringConstraints
 from uuid import UUID
 
 
@@ -138,14 +138,19 @@ class ReprocessCheckResponse(BaseModel):
 
 
 # Authentication schemas
+# Emails are stored lowercased; normalizing during validation keeps handlers from repeating it
+Email = Annotated[str, StringConstraints(strip_whitespace=True, to_lower=True)]
+ValidatedEmail = Annotated[Email, StringConstraints(pattern=r'^[^@]+@[^@]+\.[^@]+$')]
+
+
 class UserRegister(BaseModel):
-    email: str = Field(..., pattern=r'^[^@]+@[^@]+\.[^@]+$')
+    email: ValidatedEmail
     password: str = Field(..., min_length=8)
     full_name: Optional[str] = None
 
 
 class UserLogin(BaseModel):
-    email: str
+    email: Email
     password: str
 
 
@@ -166,7 +171,7 @@ class UserResponse(BaseModel):
 
 
 class PasswordResetRequest(BaseModel):
-    email: str
+    email: Email
 
 
 class PasswordReset(BaseModel):
@@ -181,7 +186,7 @@ class PasswordChange(BaseModel):
 
 # Session-based login (email -> session + OTP -> verify OTP -> password -> access)
 class SessionStartRequest(BaseModel):
-    email: str = Field(..., pattern=r'^[^@]+@[^@]+\.[^@]+$')
+    email: ValidatedEmail
 
 
 class SessionStartResponse(BaseModel):
@@ -11,6 +11,7 @@ from typing import Optional, Tuple
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from app.encryption import PHICipher
 
 logger = logging.getLogger(__name__)
 
@@ -54,8 +55,8 @@ def decrypt_session_key(password: str, encrypted_key_b64: str, salt_b64: str) ->
 
 
 def put_session_key(session_id: str, fernet_key_bytes: bytes) -> None:
-    """Store decrypted session key in cache (as Fernet instance)."""
-    cipher = Fernet(fernet_key_bytes)
+    """Store decrypted session key in cache (as a PHICipher instance)."""
+    cipher = PHICipher(fernet_key_bytes)
     _session_key_cache[str(session_id)] = {
         "cipher": cipher,
         "expires_at": datetime.utcnow() + timedelta(hours=UNLOCK_TTL_HOURS),
@@ -63,8 +64,8 @@ def put_session_key(session_id: str, fernet_key_bytes: bytes) -> None:
     logger.debug(f"Session key cached for session {session_id}")
 
 
-def get_session_cipher(session_id: str) -> Optional[Fernet]:
-    """Get Fernet cipher for session from cache if present and not expired."""
+def get_session_cipher(session_id: str) -> Optional[PHICipher]:
+    """Get PHI cipher for session from cache if present and not expired."""
     sid = str(session_id)
     if sid not in _session_key_cache:
         return None
@@ -75,6 +76,14 @@ def get_session_cipher(session_id: str) -> Optional[Fernet]:
     return entry["cipher"]
 
 
+def refresh_session_key(session_id: str) -> bool:
+    """Extend the unlock TTL of a cached session key. Returns False if it isn't cached (or expired)."""
+    if get_session_cipher(session_id) is None:
+        return False
+    _session_key_cache[str(session_id)]["expires_at"] = datetime.utcnow() + timedelta(hours=UNLOCK_TTL_HOURS)
+    return True
+
+
 def clear_session_key(session_id: str) -> None:
     """Remove session key from cache (e.g. on lock)."""
     _session_key_cache.pop(str(session_id), None)
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration at import time: point it at a throwaway SQLite
+# database and upload directory before anything imports it
+_workdir = tempfile.mkdtemp(prefix="data-manager-tests-")
+os.chdir(_workdir)
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_workdir, 'test.db')}")
+os.environ.setdefault("ENCRYPTION_KEY", "test-encryption-password")
+# Startup would stamp the fresh database through Alembic; the schema is created directly instead
+os.environ.setdefault("MIGRATION_MODE", "skip")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app.db import Base, engine  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    Base.metadata.create_all(bind=engine)
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture
+def session_headers(client):
+    """Auth headers for a fresh user with an unlocked data session"""
+    email = f"user-{os.urandom(4).hex()}@example.org"
+    client.post("/api/auth/register", json={"email": email, "password": "password123", "full_name": "Test User"})
+    token = client.post("/api/auth/login-json", json={"email": email, "password": "password123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    session_id = client.post("/api/auth/data-sessions", json={"name": "Test", "password": "sessionpass123"}, headers=headers).json()["id"]
+    unlocked = client.post(f"/api/auth/data-sessions/{session_id}/unlock", json={"password": "sessionpass123"}, headers=headers)
+    return {"Authorization": f"Bearer {unlocked.json()['access_token']}"}
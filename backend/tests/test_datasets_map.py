@@ -0,0 +1,57 @@
+from sqlalchemy import text
+
+from app.db import engine
+
+REPEAT_VISITS_CSV = (
+    "MRN,First Name,Last Name,Date of Service,Points\n"
+    "100,Ann,Lee,3/10/2025,1\n"
+    "200,Bob,Ray,3/11/2025,2\n"
+    "100,Ann,Lee,4/10/2025,3\n"
+    "300,Cy,Poe,3/12/2025,4\n"
+    "400,Di,Fox,3/13/2025,5\n"
+    "500,Ed,Kim,3/14/2025,6\n"
+)
+COLUMN_MAP = {
+    "mrn": "MRN",
+    "first_name": "First Name",
+    "last_name": "Last Name",
+    "date_of_service": "Date of Service",
+    "points": "Points",
+}
+
+
+def _patient_count(dataset_id):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT count(*) FROM patients WHERE dataset_id = :id"), {"id": dataset_id}).scalar()
+
+
+def _upload_dataset(client, headers, content):
+    response = client.post(
+        "/api/datasets/upload",
+        files={"file": ("visits.csv", content.encode(), "text/csv")},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def test_map_keeps_repeat_visits_with_the_same_mrn(client, session_headers):
+    dataset_id = _upload_dataset(client, session_headers, REPEAT_VISITS_CSV)
+
+    response = client.post(f"/api/datasets/{dataset_id}/map", json={"column_map": COLUMN_MAP}, headers=session_headers)
+
+    assert response.status_code == 200
+    assert response.json()["patients_created"] == 6
+    assert response.json()["patients_updated"] == 0
+    assert _patient_count(dataset_id) == 6
+
+
+def test_remap_matches_existing_patients_instead_of_duplicating(client, session_headers):
+    dataset_id = _upload_dataset(client, session_headers, REPEAT_VISITS_CSV)
+    client.post(f"/api/datasets/{dataset_id}/map", json={"column_map": COLUMN_MAP}, headers=session_headers)
+
+    response = client.post(f"/api/datasets/{dataset_id}/map", json={"column_map": COLUMN_MAP}, headers=session_headers)
+
+    assert response.status_code == 200
+    assert response.json()["patients_created"] == 0
+    assert _patient_count(dataset_id) == 6
@@ -0,0 +1,46 @@
+import logging
+
+import pytest
+
+from app.db import SessionLocal, sql_logger
+from app.models import Patient
+
+PHI_VALUES = ("J029843", "Grady", "Williams")
+
+
+@pytest.fixture
+def sql_records(caplog):
+    sql_logger.setLevel(logging.DEBUG)
+    caplog.set_level(logging.DEBUG, logger=sql_logger.name)
+    yield caplog
+    sql_logger.setLevel(logging.NOTSET)
+
+
+def test_sql_log_redacts_phi_inside_json_columns(client, session_headers, sql_records):
+    dataset = client.post(
+        "/api/datasets/upload",
+        files={"file": ("patients.csv", b"MRN,FN,LN\n", "text/csv")},
+        headers=session_headers,
+    ).json()
+    sql_records.clear()
+
+    db = SessionLocal()
+    try:
+        db.add(Patient(
+            dataset_id=dataset["id"],
+            patient_key="1",
+            mrn="J029843",
+            first_name="Grady",
+            last_name="Williams",
+            raw={"MRN": "J029843", "FN": "Grady", "LN": "Williams"},
+            extra_fields={"Patient Name": "Grady Williams"},
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+    messages = [record.getMessage() for record in sql_records.records if record.name == sql_logger.name]
+    assert any("INSERT INTO patients" in message for message in messages)
+    for message in messages:
+        for value in PHI_VALUES:
+            assert value not in message
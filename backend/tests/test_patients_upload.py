@@ -0,0 +1,61 @@
+def _upload(client, headers, content):
+    return client.post(
+        "/api/patients/upload-file",
+        files={"file": ("patients.csv", content.encode(), "text/csv")},
+        headers=headers,
+    )
+
+
+def _extra_fields_by_key(client, headers):
+    items = client.get("/api/patients/all", headers=headers).json()["items"]
+    return {item["patient_key"]: item["extra_fields"] for item in items}
+
+
+def test_upload_rows_with_and_without_extra_columns(client, session_headers):
+    # M1 and M3 have nothing in the unmapped columns, M2 fills both
+    response = _upload(client, session_headers, "MRN,First Name,Zed,Note\nM1,Ann\nM2,Bob,b,second\nM3,Cy,,\n")
+
+    assert response.status_code == 200
+    assert response.json()["patients_created"] == 3
+    extra_fields = _extra_fields_by_key(client, session_headers)
+    assert extra_fields["M2"] == {"Zed": "b", "Note": "second"}
+    for key in ("M1", "M3"):
+        assert not any((extra_fields[key] or {}).values())
+
+
+def test_upload_without_extra_columns(client, session_headers):
+    response = _upload(client, session_headers, "MRN,First Name\nM1,Ann\nM2,Bob\n")
+
+    assert response.status_code == 200
+    assert response.json()["patients_created"] == 2
+    assert _extra_fields_by_key(client, session_headers) == {"M1": None, "M2": None}
+
+
+def test_upload_batch_mixes_rows_with_and_without_extra_fields(client, session_headers, monkeypatch):
+    # With blanks read as None (not NaN), rows without extra values build no extra_fields at all.
+    # They must still share one INSERT executemany with the rows that have them.
+    import pandas as pd
+    from sqlalchemy import event
+    from app.db import engine
+
+    read_csv = pd.read_csv
+    monkeypatch.setattr(
+        pd, "read_csv",
+        lambda *args, **kwargs: (lambda df: df.astype(object).where(pd.notna(df), None))(read_csv(*args, **kwargs)),
+    )
+    inserts = []
+
+    def count_patient_inserts(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO patients"):
+            inserts.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_patient_inserts)
+    try:
+        response = _upload(client, session_headers, "MRN,First Name,Zed\nM1,Ann,\nM2,Bob,b\nM3,Cy,\nM4,Di,d\n")
+    finally:
+        event.remove(engine, "before_cursor_execute", count_patient_inserts)
+
+    assert response.status_code == 200
+    assert response.json()["patients_created"] == 4
+    assert len(inserts) == 1
+    assert _extra_fields_by_key(client, session_headers) == {"M1": None, "M2": {"Zed": "b"}, "M3": None, "M4": {"Zed": "d"}}